@@ -1,13 +1,21 @@
 import os
+import sys
+import atexit
 from pathlib import Path
 from datetime import datetime
 import pytz
 import secrets
 import re
+import time
+import hashlib
+import gzip
+import json
+import threading
+from functools import wraps
 
 from flask import (
     Flask, request, render_template, abort, jsonify,
-    redirect, url_for, flash, send_from_directory
+    redirect, url_for, flash, send_file
 )
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -18,6 +26,10 @@ from flask_login import (
 from sqlalchemy import create_engine, text
 import markdown as md
 from werkzeug.exceptions import HTTPException
+from markupsafe import Markup
+
+import storage
+import migrations
 
 # ================== Paths & App ==================
 BASE = Path(__file__).resolve().parent
@@ -29,6 +41,10 @@ LOGS.mkdir(parents=True, exist_ok=True)
 STATUS_LOG = LOGS / "status.log"
 ERROR_LOG = LOGS / "error.log"
 
+# uploaded CSVs + status feed (local disk or S3-compatible; see storage.py),
+# built per process on first use
+STORE = storage.LazyStorage(lambda: storage.from_env(UPLOADS, STATUS_LOG))
+
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "devsecret")
 app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "10")) * 1024 * 1024
@@ -38,42 +54,47 @@ login_manager = LoginManager(app)
 login_manager.login_view = "login"
 
 DB_PATH = BASE / "app.db"
-engine = create_engine(f"sqlite:///{DB_PATH.as_posix()}", echo=False, future=True)
 TZ = pytz.timezone("Asia/Beirut")
 NOW = lambda: datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
 
-def db_init():
-    with engine.begin() as conn:
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            position TEXT,
-            role TEXT NOT NULL DEFAULT 'viewer',
-            password_hash TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        );
-        """))
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS news (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            body_md TEXT NOT NULL,
-            html TEXT NOT NULL,
-            published INTEGER NOT NULL DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            author_id INTEGER
-        );
-        """))
-    print(f"[INIT] Database initialized at {DB_PATH}")
-
-def create_or_reset_admin():
-    # Ensure admin exists and matches env on every boot
+# Nothing touches the database at import time: with gunicorn --preload the
+# master imports this module once and each forked worker creates its own
+# engine on first use. Schema changes live in migrations.py and the admin
+# reset in `python app.py bootstrap`.
+_engine = {"pid": None, "engine": None}
+_engine_lock = threading.Lock()
+
+def get_engine():
+    pid = os.getpid()
+    if _engine["pid"] != pid:
+        with _engine_lock:
+            if _engine["pid"] != pid:
+                eng = create_engine(f"sqlite:///{DB_PATH.as_posix()}", echo=False, future=True)
+                migrations.migrate(eng)
+                ensure_admin(eng)
+                _sync_env_api_key(eng)
+                _engine.update(pid=pid, engine=eng)
+    return _engine["engine"]
+
+def db():
+    return get_engine().begin()
+
+def _admin_params():
     admin_email = os.getenv("ADMIN_EMAIL", "admin@example.com").strip()
     admin_pass = os.getenv("ADMIN_PASSWORD", "admin123").strip()
-    with engine.begin() as conn:
+    return admin_pass, {"u": "admin", "e": admin_email, "p": "Owner", "r": "admin", "c": NOW()}
+
+def ensure_admin(eng):
+    """Create the admin on a fresh database; existing rows are left alone."""
+    with eng.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM users WHERE username='admin'")).fetchone():
+            return
+    create_or_reset_admin(eng)
+
+def create_or_reset_admin(eng):
+    # Ensure admin exists and matches env (run by `python app.py bootstrap`)
+    admin_pass, params = _admin_params()
+    with eng.begin() as conn:
         conn.execute(text("""
             INSERT INTO users (username,email,position,role,password_hash,created_at)
             VALUES (:u,:e,:p,:r,:h,:c)
@@ -82,18 +103,17 @@ def create_or_reset_admin():
                 position=excluded.position,
                 role=excluded.role,
                 password_hash=excluded.password_hash
-        """), {
-            "u": "admin",
-            "e": admin_email,
-            "p": "Owner",
-            "r": "admin",
-            "h": generate_password_hash(admin_pass),
-            "c": NOW()
-        })
+        """), {**params, "h": generate_password_hash(admin_pass)})
     print(f"[INIT] Admin user reset to 'admin' / {admin_pass}")
 
-db_init()
-create_or_reset_admin()
+def bootstrap():
+    """One-time setup per deploy: migrate, reset admin from env, register DASH_API_KEY."""
+    eng = create_engine(f"sqlite:///{DB_PATH.as_posix()}", echo=False, future=True)
+    version = migrations.migrate(eng)
+    print(f"[INIT] Database at {DB_PATH} is at schema version {version}")
+    create_or_reset_admin(eng)
+    _sync_env_api_key(eng)
+    eng.dispose()
 
 # ================== User model ==================
 class User(UserMixin):
@@ -108,49 +128,343 @@ class User(UserMixin):
 
 @login_manager.user_loader
 def load_user(user_id):
-    with engine.begin() as conn:
+    with db() as conn:
         row = conn.execute(text(
             "SELECT id, username, email, position, role, password_hash, created_at FROM users WHERE id=:id"
         ), {"id": user_id}).fetchone()
     return User(*row) if row else None
 
 # ================== Helpers ==================
-def append_status_line(status, msg):
-    STATUS_LOG.parent.mkdir(parents=True, exist_ok=True)
-    with open(STATUS_LOG, "a", encoding="utf-8") as f:
-        f.write(f"[{status.upper()}] {NOW()} - {msg}\n")
+def append_status_line(status, msg, run_id=""):
+    run = f" [run {run_id}]" if run_id else ""
+    STORE.append_status(f"[{status.upper()}] {NOW()}{run} - {msg}")
+
+def _run_id_from_request(data=None):
+    """Correlation ID sent by the sync job (JSON 'run_id' or X-Run-Id header)."""
+    rid = ((data or {}).get("run_id") or request.headers.get("X-Run-Id") or "").strip()
+    return re.sub(r"[^0-9A-Za-z_-]", "", rid)[:64]
+
+# ================== Exports index (plain / gzip / zstd) ==================
+# Exports may arrive compressed (name.csv.gz / name.csv.zst) and are stored as
+# sent; the index maps the plain name.csv to whatever is stored, newest wins.
+EXPORT_ENCODINGS = {".csv": "", ".csv.gz": "gzip", ".csv.zst": "zstd"}
+MAGIC = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd"}
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def _split_export_name(stored):
+    for ext, enc in sorted(EXPORT_ENCODINGS.items(), key=lambda kv: -len(kv[0])):
+        if stored.lower().endswith(ext):
+            return stored[:len(stored) - len(ext)] + ".csv", enc
+    return None, None
+
+def _export_index():
+    index = {}
+    for obj in STORE.list():
+        name, enc = _split_export_name(obj["name"])
+        if name is None or name in index:
+            continue  # STORE.list() is newest first
+        index[name] = {**obj, "name": name, "stored": obj["name"], "encoding": enc}
+    return index
+
+class _ClosingGzipFile(gzip.GzipFile):
+    """GzipFile that also closes the stored file it reads from (GzipFile leaves fileobj open)."""
+    def __init__(self, fh):
+        super().__init__(fileobj=fh, mode="rb")
+        self._source = fh
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._source.close()
+
+def _open_decoded(stored, encoding):
+    fh = STORE.open(stored)
+    if encoding == "gzip":
+        return _ClosingGzipFile(fh)
+    if encoding == "zstd":
+        if zstandard is None:
+            fh.close()
+            abort(500, description="zstandard is not installed on this server")
+        return zstandard.ZstdDecompressor().stream_reader(fh, closefd=True)
+    return fh
 
 def list_csvs():
     items = []
-    for p in sorted(UPLOADS.glob("*.csv"), key=lambda x: x.stat().st_mtime, reverse=True):
-        mtime_utc = datetime.fromtimestamp(p.stat().st_mtime, tz=pytz.UTC)
+    for obj in _export_index().values():
+        mtime_utc = datetime.fromtimestamp(obj["mtime"], tz=pytz.UTC)
         mtime_local = mtime_utc.astimezone(TZ)
         items.append({
-            "name": p.name,
-            "size_kb": max(1, p.stat().st_size // 1024),
+            "name": obj["name"],
+            "size_kb": max(1, obj["size"] // 1024),
             "mtime": mtime_local.strftime("%Y-%m-%d %H:%M:%S"),
+            "encoding": obj["encoding"],
         })
     return items
 
 def _read_status_lines(limit=200):
-    if not STATUS_LOG.exists():
-        return []
-    return STATUS_LOG.read_text(encoding="utf-8").splitlines()[-limit:]
+    return STORE.tail_status(limit)
+
+# ================== Fragment cache ==================
+# The status and files panels are rebuilt only when the underlying data
+# changes: the key is the backend's version marker, which comes from the
+# shared store, so every worker derives the same version (and ETag) for the
+# same data. A backend returning None falls back to FRAGMENT_TTL_SEC.
+FRAGMENT_TTL_SEC = float(os.getenv("FRAGMENT_TTL_SEC", "10"))
+_fragments = {}
+_fragment_lock = threading.Lock()
+
+def _data_version(kind):
+    marker = STORE.version(kind)
+    if marker is None:
+        marker = int(time.time() // FRAGMENT_TTL_SEC)
+    return hashlib.sha1(repr((kind, marker)).encode()).hexdigest()[:16]
+
+def cached_fragment(name, kind, build):
+    """Return (version, value) for a panel, calling build() only on a version change."""
+    version = _data_version(kind)
+    with _fragment_lock:
+        hit = _fragments.get(name)
+        if hit and hit[0] == version:
+            return hit
+    value = build()
+    with _fragment_lock:
+        _fragments[name] = (version, value)
+    return version, value
+
+def _not_modified(etag):
+    """True if the client already holds this version (any Content-Encoding variant)."""
+    return any(tag in request.if_none_match for tag in (etag, f"{etag}-gzip", f"{etag}-br"))
+
+def _versioned_json(name, kind, build):
+    version, body = cached_fragment(name, kind, lambda: json.dumps(build()))
+    etag = f"{name}-{version}"
+    if _not_modified(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
 
 def _role_guard(roles):
     return current_user.is_authenticated and current_user.role in roles
 
-def _api_key_allowed():
-    """Allow API calls if either:
-       - a matching X-API-Key is provided (when DASH_API_KEY is configured), OR
-       - a logged-in admin/editor performs the action.
-       If DASH_API_KEY is not set, do NOT require a key (dev mode)."""
-    api_key_env = os.getenv("DASH_API_KEY", "")
-    if not api_key_env:
-        return True  # no key configured -> dev/easy mode
-    if (current_user.is_authenticated and current_user.role in ("admin", "editor")):
-        return True
-    return request.headers.get("X-API-Key") == api_key_env
+# ================== API keys / admission control ==================
+# Limits are enforced per worker process (gunicorn --workers=N gives each key
+# N times the configured rate); usage counters are shared through the DB.
+# Counters are kept in memory and flushed every USAGE_FLUSH_SEC by an admitted
+# request (and at exit), so rejections never touch the database.
+DEFAULT_RATE_PER_MIN = int(os.getenv("API_RATE_PER_MIN", "60"))
+DEFAULT_BURST        = int(os.getenv("API_BURST", "20"))
+DEFAULT_MAX_UPLOADS  = int(os.getenv("API_MAX_UPLOADS", "2"))
+# shed ingest traffic once this many requests are in flight in this worker,
+# leaving the remaining threads for the UI
+SHED_INFLIGHT        = int(os.getenv("SHED_INFLIGHT", "6"))
+KEYS_TTL_SEC         = 5.0
+USAGE_FLUSH_SEC      = float(os.getenv("USAGE_FLUSH_SEC", "10"))
+
+def _hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+class TokenBucket:
+    def __init__(self, rate_per_min, burst):
+        self.rate = max(rate_per_min, 1) / 60.0
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Return 0 if a token was taken, else seconds until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+_keys_cache = {"at": 0.0, "by_hash": {}}
+_buckets = {}
+_upload_slots = {}
+_admission_lock = threading.Lock()
+_inflight = 0
+USAGE_COLS = ("requests", "uploads", "bytes_in", "throttled", "shed")
+_usage_pending = {}  # principal -> {col: count, "last_seen": ts}
+_usage_lock = threading.Lock()
+_usage_flushed_at = time.monotonic()
+
+def _sync_env_api_key(eng):
+    """Register the legacy single DASH_API_KEY as the 'default' named key."""
+    key = os.getenv("DASH_API_KEY", "").strip()
+    with eng.begin() as conn:
+        row = conn.execute(text("SELECT key_hash FROM api_keys WHERE name='default'")).fetchone()
+        if not key:
+            if row:
+                conn.execute(text("DELETE FROM api_keys WHERE name='default'"))
+            return
+        if row and row[0] == _hash_key(key):
+            return
+        conn.execute(text("""
+            INSERT INTO api_keys (name,key_hash,rate_per_min,burst,max_uploads,created_at)
+            VALUES ('default',:h,:r,:b,:m,:c)
+            ON CONFLICT(name) DO UPDATE SET key_hash=excluded.key_hash
+        """), {"h": _hash_key(key), "r": DEFAULT_RATE_PER_MIN, "b": DEFAULT_BURST,
+               "m": DEFAULT_MAX_UPLOADS, "c": NOW()})
+
+def _api_keys():
+    now = time.monotonic()
+    if now - _keys_cache["at"] > KEYS_TTL_SEC:
+        with db() as conn:
+            rows = conn.execute(text(
+                "SELECT name, key_hash, rate_per_min, burst, max_uploads FROM api_keys"
+            )).fetchall()
+        _keys_cache["by_hash"] = {r[1]: {"name": r[0], "rate_per_min": r[2], "burst": r[3],
+                                         "max_uploads": r[4]} for r in rows}
+        _keys_cache["at"] = now
+    return _keys_cache["by_hash"]
+
+def _invalidate_api_keys():
+    _keys_cache["at"] = 0.0
+
+def _resolve_principal():
+    """Who is calling an ingest endpoint, or None if not allowed.
+       - a logged-in admin/editor, OR
+       - a matching X-API-Key from the api_keys table (DASH_API_KEY is 'default').
+       If no keys are configured at all, do NOT require a key (dev mode)."""
+    keys = _api_keys()
+    limits = {"rate_per_min": DEFAULT_RATE_PER_MIN, "burst": DEFAULT_BURST,
+              "max_uploads": DEFAULT_MAX_UPLOADS}
+    if current_user.is_authenticated and current_user.role in ("admin", "editor"):
+        return {"name": f"user:{current_user.username}", **limits}
+    sent = request.headers.get("X-API-Key", "")
+    if sent:
+        hit = keys.get(_hash_key(sent))
+        if hit:
+            return hit
+    if not keys:
+        return {"name": "anonymous", **limits}  # no keys configured -> dev/easy mode
+    return None
+
+def _record_usage(principal, **inc):
+    """Count usage in this process's memory; flush_usage() writes it to api_usage."""
+    with _usage_lock:
+        row = _usage_pending.setdefault(principal, dict.fromkeys(USAGE_COLS, 0))
+        for c in USAGE_COLS:
+            row[c] += int(inc.get(c, 0))
+        row["last_seen"] = NOW()
+
+def flush_usage(force=False):
+    """Add the pending counters to api_usage in one transaction (at most every USAGE_FLUSH_SEC)."""
+    global _usage_flushed_at
+    with _usage_lock:
+        if not _usage_pending or (not force and time.monotonic() - _usage_flushed_at < USAGE_FLUSH_SEC):
+            return
+        pending = dict(_usage_pending)
+        _usage_pending.clear()
+        _usage_flushed_at = time.monotonic()
+    try:
+        with db() as conn:
+            conn.execute(text("""
+                INSERT INTO api_usage (principal,requests,uploads,bytes_in,throttled,shed,last_seen)
+                VALUES (:p,:requests,:uploads,:bytes_in,:throttled,:shed,:last_seen)
+                ON CONFLICT(principal) DO UPDATE SET
+                    requests=requests+excluded.requests,
+                    uploads=uploads+excluded.uploads,
+                    bytes_in=bytes_in+excluded.bytes_in,
+                    throttled=throttled+excluded.throttled,
+                    shed=shed+excluded.shed,
+                    last_seen=excluded.last_seen
+            """), [{"p": p, **row} for p, row in pending.items()])
+    except Exception:
+        # counters are best effort; keep them for the next flush
+        with _usage_lock:
+            for p, row in pending.items():
+                cur = _usage_pending.setdefault(p, dict.fromkeys(USAGE_COLS, 0))
+                for c in USAGE_COLS:
+                    cur[c] += row[c]
+                cur.setdefault("last_seen", row["last_seen"])
+
+atexit.register(flush_usage, force=True)
+
+def _too_many(retry_after, description):
+    resp = jsonify(ok=False, error=description)
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+    return resp
+
+@app.before_request
+def _count_inflight():
+    global _inflight
+    with _admission_lock:
+        _inflight += 1
+
+@app.teardown_request
+def _uncount_inflight(exc=None):
+    global _inflight
+    with _admission_lock:
+        _inflight -= 1
+
+def admit(kind):
+    """
+    Admission control for ingest endpoints: authenticate the key, shed load when
+    this worker is saturated, apply the key's token bucket and, for uploads,
+    its concurrency cap. Rejections are 429 with Retry-After.
+    """
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            principal = _resolve_principal()
+            if principal is None:
+                abort(403, description="Forbidden: bad or missing X-API-Key")
+            name = principal["name"]
+
+            with _admission_lock:
+                inflight = _inflight
+            if inflight > SHED_INFLIGHT:
+                _record_usage(name, shed=1)
+                return _too_many(2, "Server busy, retry later")
+
+            with _admission_lock:
+                bucket = _buckets.get(name)
+                if (bucket is None or bucket.capacity != max(principal["burst"], 1)
+                        or bucket.rate != max(principal["rate_per_min"], 1) / 60.0):
+                    bucket = _buckets[name] = TokenBucket(principal["rate_per_min"], principal["burst"])
+            wait = bucket.take()
+            if wait:
+                _record_usage(name, throttled=1)
+                return _too_many(wait, "Rate limit exceeded")
+
+            if kind != "upload":
+                _record_usage(name, requests=1)
+                flush_usage()
+                return fn(*args, **kwargs)
+
+            with _admission_lock:
+                busy = _upload_slots.get(name, 0)
+                if busy >= max(principal["max_uploads"], 1):
+                    busy = None
+                else:
+                    _upload_slots[name] = busy + 1
+            if busy is None:
+                _record_usage(name, throttled=1)
+                return _too_many(5, "Too many concurrent uploads for this key")
+            try:
+                resp = fn(*args, **kwargs)
+                _record_usage(name, requests=1, uploads=1, bytes_in=request.content_length or 0)
+                flush_usage()
+                return resp
+            finally:
+                with _admission_lock:
+                    _upload_slots[name] -= 1
+        return wrapper
+    return deco
 
 @app.route("/healthz")
 def healthz():
@@ -163,10 +477,9 @@ def debug_env():
 # ================== Routes: Core ==================
 @app.route("/")
 def home():
+    # the activity panel loads from /api/status, so nothing to read here
     return render_template(
         "home.html",
-        csvs=list_csvs(),               # still used by /api if you want
-        lines=_read_status_lines(),
         year=datetime.now().year,
         active="home",
     )
@@ -272,14 +585,18 @@ def _build_activity_entries():
 @app.route("/files")
 @login_required
 def files_page():
-    return render_template("files.html", csvs=list_csvs(), year=datetime.now().year, active="files")
+    _, table = cached_fragment(
+        "files-table", "files",
+        lambda: Markup(render_template("_files_table.html", csvs=list_csvs())),
+    )
+    return render_template("files.html", files_table=table, year=datetime.now().year, active="files")
 
 @app.route("/login", methods=["GET","POST"])
 def login():
     if request.method == "POST":
         username = request.form.get("username","").strip()
         password = request.form.get("password","")
-        with engine.begin() as conn:
+        with db() as conn:
             row = conn.execute(text(
                 "SELECT id, username, email, position, role, password_hash, created_at FROM users WHERE username=:u"
             ), {"u": username}).fetchone()
@@ -314,7 +631,7 @@ def profile():
         if not username:
             flash("Username is required")
             return redirect(url_for("profile"))
-        with engine.begin() as conn:
+        with db() as conn:
             if new_pw:
                 conn.execute(text("""
                     UPDATE users SET username=:u, position=:p, password_hash=:h WHERE id=:id
@@ -326,7 +643,7 @@ def profile():
         flash("Profile updated")
         return redirect(url_for("profile"))
 
-    with engine.begin() as conn:
+    with db() as conn:
         row = conn.execute(text(
             "SELECT id, username, email, position, role, password_hash, created_at FROM users WHERE id=:id"
         ), {"id": current_user.id}).fetchone()
@@ -351,7 +668,7 @@ def users_admin():
             return redirect(url_for("users_admin"))
         gen_pw = secrets.token_urlsafe(8)
         try:
-            with engine.begin() as conn:
+            with db() as conn:
                 conn.execute(text("""
                     INSERT INTO users (username,email,position,role,password_hash,created_at)
                     VALUES (:u,:e,:p,:r,:h,:c)
@@ -360,20 +677,82 @@ def users_admin():
             flash(f"User created. Temp password: {gen_pw}")
         except Exception:
             flash("Failed to create user (possibly duplicate username/email).")
-    with engine.begin() as conn:
+    with db() as conn:
         rows = conn.execute(text(
             "SELECT id, username, email, position, role, created_at FROM users ORDER BY id"
         )).fetchall()
     users = [{"id": r[0], "username": r[1], "email": r[2], "position": r[3],
               "role": r[4], "created_at": r[5]} for r in rows]
-    return render_template("users.html", users=users, year=datetime.now().year, active="users")
+    return render_template("users.html", users=users, api_keys=_api_key_rows(),
+                           usage=_api_usage_rows(), year=datetime.now().year, active="users")
+
+def _api_key_rows():
+    with db() as conn:
+        rows = conn.execute(text("""
+            SELECT k.id, k.name, k.rate_per_min, k.burst, k.max_uploads, k.created_at
+            FROM api_keys k ORDER BY k.name
+        """)).fetchall()
+    return [{"id": r[0], "name": r[1], "rate_per_min": r[2], "burst": r[3],
+             "max_uploads": r[4], "created_at": r[5]} for r in rows]
+
+def _api_usage_rows():
+    flush_usage(force=True)
+    with db() as conn:
+        rows = conn.execute(text("""
+            SELECT principal, requests, uploads, bytes_in, throttled, shed, last_seen
+            FROM api_usage ORDER BY last_seen DESC
+        """)).fetchall()
+    return [{"principal": r[0], "requests": r[1], "uploads": r[2],
+             "mb_in": round((r[3] or 0) / (1024 * 1024), 2), "throttled": r[4],
+             "shed": r[5], "last_seen": r[6]} for r in rows]
+
+@app.route("/api-keys", methods=["POST"])
+@login_required
+def api_key_create():
+    if not _role_guard(("admin",)):
+        abort(403)
+    name = request.form.get("name","").strip()
+    if not name or name == "default":
+        flash("Key name is required ('default' is reserved for DASH_API_KEY)")
+        return redirect(url_for("users_admin"))
+    try:
+        rate = int(request.form.get("rate_per_min") or DEFAULT_RATE_PER_MIN)
+        burst = int(request.form.get("burst") or DEFAULT_BURST)
+        max_uploads = int(request.form.get("max_uploads") or DEFAULT_MAX_UPLOADS)
+    except ValueError:
+        flash("Limits must be whole numbers")
+        return redirect(url_for("users_admin"))
+    key = secrets.token_urlsafe(24)
+    try:
+        with db() as conn:
+            conn.execute(text("""
+                INSERT INTO api_keys (name,key_hash,rate_per_min,burst,max_uploads,created_at)
+                VALUES (:n,:h,:r,:b,:m,:c)
+            """), {"n": name, "h": _hash_key(key), "r": rate, "b": burst,
+                   "m": max_uploads, "c": NOW()})
+        _invalidate_api_keys()
+        flash(f"API key '{name}' created. Copy it now, it will not be shown again: {key}")
+    except Exception:
+        flash("Failed to create API key (possibly duplicate name).")
+    return redirect(url_for("users_admin"))
+
+@app.route("/api-keys/<int:key_id>/delete", methods=["POST"])
+@login_required
+def api_key_delete(key_id):
+    if not _role_guard(("admin",)):
+        abort(403)
+    with db() as conn:
+        conn.execute(text("DELETE FROM api_keys WHERE id=:id AND name<>'default'"), {"id": key_id})
+    _invalidate_api_keys()
+    flash("API key deleted")
+    return redirect(url_for("users_admin"))
 
 @app.route("/users/<int:user_id>/edit", methods=["GET","POST"])
 @login_required
 def user_edit(user_id):
     if not _role_guard(("admin",)):
         abort(403)
-    with engine.begin() as conn:
+    with db() as conn:
         row = conn.execute(text(
             "SELECT id, username, email, position, role, password_hash, created_at FROM users WHERE id=:id"
         ), {"id": user_id}).fetchone()
@@ -389,7 +768,7 @@ def user_edit(user_id):
         new_pw   = request.form.get("password","")
         if role not in ("viewer","editor","admin"):
             role = "viewer"
-        with engine.begin() as conn:
+        with db() as conn:
             if new_pw:
                 conn.execute(text("""
                     UPDATE users SET username=:u,email=:e,position=:p,role=:r,password_hash=:h WHERE id=:id
@@ -412,7 +791,7 @@ def user_delete(user_id):
     if current_user.id == user_id:
         flash("You cannot delete your own account.")
         return redirect(url_for("users_admin"))
-    with engine.begin() as conn:
+    with db() as conn:
         conn.execute(text("DELETE FROM users WHERE id=:id"), {"id": user_id})
     flash("User deleted")
     return redirect(url_for("users_admin"))
@@ -420,7 +799,7 @@ def user_delete(user_id):
 # ================== Routes: News ==================
 @app.route("/news")
 def news_list():
-    with engine.begin() as conn:
+    with db() as conn:
         rows = conn.execute(text("""
             SELECT id, title, body_md, html, published, created_at, updated_at
             FROM news ORDER BY id DESC
@@ -439,7 +818,7 @@ def news_new():
         body_md = request.form.get("body","")
         published = 1 if request.form.get("published","1") == "1" else 0
         html = md.markdown(body_md)
-        with engine.begin() as conn:
+        with db() as conn:
             conn.execute(text("""
                 INSERT INTO news (title, body_md, html, published, created_at, updated_at, author_id)
                 VALUES (:t,:b,:h,:p,:c,:u,:a)
@@ -453,7 +832,7 @@ def news_new():
 def news_edit(post_id):
     if not _role_guard(("admin","editor")):
         abort(403)
-    with engine.begin() as conn:
+    with db() as conn:
         row = conn.execute(text("""
             SELECT id, title, body_md, html, published, created_at, updated_at FROM news WHERE id=:id
         """), {"id": post_id}).fetchone()
@@ -469,7 +848,7 @@ def news_edit(post_id):
         body_md = request.form.get("body","")
         published = 1 if request.form.get("published","1") == "1" else 0
         html = md.markdown(body_md)
-        with engine.begin() as conn:
+        with db() as conn:
             conn.execute(text("""
                 UPDATE news SET title=:t, body_md=:b, html=:h, published=:p, updated_at=:u WHERE id=:id
             """), {"t": title, "b": body_md, "h": html, "p": published, "u": NOW(), "id": post_id})
@@ -478,45 +857,71 @@ def news_edit(post_id):
 
 # ================== Upload / Log / Download / JSON ==================
 @app.post("/upload")
+@admit("upload")
 def upload_csv():
-    if not _api_key_allowed():
-        abort(403, description="Forbidden: bad or missing X-API-Key")
     if "file" not in request.files:
         abort(400, description="Bad Request: no 'file' part")
     f = request.files["file"]
     if not f or not f.filename:
         abort(400, description="Bad Request: empty filename")
-    if not f.filename.lower().endswith(".csv"):
-        abort(400, description="Bad Request: only .csv allowed")
-    dest = UPLOADS / secure_filename(f.filename)
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    f.save(dest)
-    append_status_line("success", f"File uploaded: {f.filename}")
+    name = secure_filename(f.filename)
+    _, encoding = _split_export_name(name)
+    if encoding is None:
+        abort(400, description="Bad Request: only .csv, .csv.gz or .csv.zst allowed")
+    if encoding:
+        if encoding == "zstd" and zstandard is None:
+            abort(415, description="Unsupported Media Type: zstd not available, send gzip")
+        head = f.stream.read(4)
+        f.stream.seek(0)
+        if not head.startswith(MAGIC[encoding]):
+            abort(400, description=f"Bad Request: body is not {encoding} data")
+    STORE.save(name, f.stream)
+    append_status_line("success", f"File uploaded: {f.filename}", _run_id_from_request())
     return jsonify(ok=True, filename=f.filename)
 
 @app.post("/log")
+@admit("log")
 def post_log():
-    if not _api_key_allowed():
-        abort(403, description="Forbidden: bad or missing X-API-Key")
     data = request.get_json(silent=True) or {}
     status = (data.get("status") or "info").strip()
     message = (data.get("message") or "").strip()
     if not message:
         abort(400, description="Bad Request: 'message' required")
-    append_status_line(status, message)
+    append_status_line(status, message, _run_id_from_request(data))
     return jsonify(ok=True)
 
 @app.route("/download/<path:filename>")
 def download(filename):
-    return send_from_directory(UPLOADS.as_posix(), filename, as_attachment=True)
+    name = secure_filename(filename)
+    if not name or name != filename:
+        abort(404)
+    entry = _export_index().get(name)
+    if entry is None:
+        abort(404)
+    encoding = entry["encoding"]
+    try:
+        if encoding and encoding in request.accept_encodings:
+            # client can decode it: send the stored bytes as-is
+            resp = send_file(STORE.open(entry["stored"]), as_attachment=True,
+                             download_name=name, mimetype="text/csv")
+            resp.headers["Content-Encoding"] = encoding
+            resp.headers["Vary"] = "Accept-Encoding"
+            return resp
+        resp = send_file(_open_decoded(entry["stored"], encoding), as_attachment=True,
+                         download_name=name, mimetype="text/csv")
+        if encoding:
+            resp.headers["Vary"] = "Accept-Encoding"
+        return resp
+    except FileNotFoundError:
+        abort(404)
 
 @app.route("/api/status")
 def api_status():
-    return jsonify({"ok": True, "entries": _build_activity_entries()})
+    return _versioned_json("status", "status", lambda: {"ok": True, "entries": _build_activity_entries()})
 
 @app.route("/api/csvs")
 def api_csvs():
-    return jsonify({"ok": True, "items": list_csvs()})
+    return _versioned_json("csvs", "files", lambda: {"ok": True, "items": list_csvs()})
 
 @app.route("/log/<run_slug>")
 def log_run(run_slug):
@@ -544,6 +949,88 @@ def contact():
 def about():
     return render_template("about.html", year=datetime.now().year, active="about")
 
+# ================== Static fingerprints / compression ==================
+# url_for('static', ...) gets ?v=<content hash>; a request carrying the current
+# hash is served with a one-year immutable cache lifetime.
+STATIC_IMMUTABLE = "public, max-age=31536000, immutable"
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "512"))
+COMPRESS_TYPES = ("text/html", "application/json")
+_static_hashes = {}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def _static_hash(filename):
+    path = Path(app.static_folder) / filename
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return None
+    hit = _static_hashes.get(filename)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()[:12]
+    _static_hashes[filename] = (mtime, digest)
+    return digest
+
+@app.url_defaults
+def _fingerprint_static(endpoint, values):
+    if endpoint == "static" and "filename" in values and "v" not in values:
+        digest = _static_hash(values["filename"])
+        if digest:
+            values["v"] = digest
+
+def _response_encoding():
+    """Content-Encoding to compress with for this request: "br", "gzip" or None."""
+    accepted = request.accept_encodings
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+@app.after_request
+def _cache_and_compress(resp):
+    if request.endpoint == "static" and resp.status_code == 200:
+        v = request.args.get("v")
+        if v and v == _static_hash(request.view_args.get("filename", "")):
+            resp.headers["Cache-Control"] = STATIC_IMMUTABLE
+            resp.expires = None
+        return resp
+
+    if resp.status_code == 304:
+        # advertise the validator of the representation the client holds,
+        # i.e. the "-gzip"/"-br" tag a compressed 200 was sent with
+        etag, weak = resp.get_etag()
+        encoding = _response_encoding()
+        if etag and encoding and f"{etag}-{encoding}" in request.if_none_match:
+            resp.set_etag(f"{etag}-{encoding}", weak)
+            resp.vary.add("Accept-Encoding")
+        return resp
+
+    if (resp.status_code != 200 or resp.direct_passthrough
+            or "Content-Encoding" in resp.headers or resp.mimetype not in COMPRESS_TYPES):
+        return resp
+    body = resp.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return resp
+    encoding = _response_encoding()
+    if encoding == "br":
+        body = brotli.compress(body, quality=5)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+    else:
+        return resp
+    resp.set_data(body)
+    resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    etag, weak = resp.get_etag()
+    if etag:
+        resp.set_etag(f"{etag}-{encoding}", weak)
+    return resp
+
 # ================== Error Handling ==================
 @app.errorhandler(HTTPException)
 def handle_http_error(e):
@@ -561,4 +1048,7 @@ def handle_any_error(e):
 
 # ================== Run ==================
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
+    if sys.argv[1:2] == ["bootstrap"]:
+        bootstrap()
+    else:
+        app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
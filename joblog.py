@@ -0,0 +1,136 @@
+"""
+Structured logging for the sync job.
+
+Every line is a JSON object stamped with the run's correlation ID, written to
+logs/integration-log.jsonl through an in-memory buffer (flushed every
+LOG_BUFFER_LINES records, on any ERROR, and at exit). The file rotates once it
+passes LOG_MAX_BYTES or LOG_ROTATE_HOURS, and rotated segments are gzipped
+(integration-log.jsonl.1.gz, .2.gz, ...; LOG_BACKUPS kept).
+
+The console still gets the plain "[KIND] time msg" lines.
+
+Env:
+    LOG_LEVEL          DEBUG / INFO / WARNING / ERROR (default DEBUG)
+    LOG_MAX_BYTES      rotate after this many bytes (default 5 MB)
+    LOG_ROTATE_HOURS   rotate after this many hours (default 24, 0 = never)
+    LOG_BACKUPS        rotated segments to keep (default 10)
+    LOG_BUFFER_LINES   records buffered before a write (default 200)
+    RUN_ID             correlation ID to use instead of a generated one
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import uuid
+import shutil
+import logging
+import logging.handlers
+from datetime import datetime
+from pathlib import Path
+
+SUCCESS = 25
+logging.addLevelName(SUCCESS, "SUCCESS")
+
+# log_line() kinds -> logging levels
+KIND_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "SUCCESS": SUCCESS,
+    "WARN": logging.WARNING,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
+
+def new_run_id() -> str:
+    return os.getenv("RUN_ID", "").strip() or uuid.uuid4().hex[:12]
+
+class JsonLineFormatter(logging.Formatter):
+    def __init__(self, tz, run_id):
+        super().__init__()
+        self.tz = tz
+        self.run_id = run_id
+
+    def format(self, record):
+        return json.dumps({
+            "ts": datetime.fromtimestamp(record.created, self.tz).isoformat(timespec="milliseconds"),
+            "level": getattr(record, "kind", record.levelname),
+            "run_id": self.run_id,
+            "msg": record.getMessage(),
+        }, ensure_ascii=False)
+
+class ConsoleFormatter(logging.Formatter):
+    def __init__(self, tz):
+        super().__init__()
+        self.tz = tz
+
+    def format(self, record):
+        ts = datetime.fromtimestamp(record.created, self.tz).strftime("%Y-%m-%d %H:%M:%S")
+        return f"[{getattr(record, 'kind', record.levelname)}] {ts} {record.getMessage()}"
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+class SizeAndTimeRotatingHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that also rolls over once the segment is max_age seconds old."""
+
+    def __init__(self, filename, max_bytes, max_age, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count,
+                         encoding="utf-8", delay=True)
+        self.max_age = max_age
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+        self.segment_started = self._read_segment_start()
+
+    def _read_segment_start(self) -> float:
+        """Start of the current segment: the first line's ts, or now for a new file."""
+        try:
+            with open(self.baseFilename, "r", encoding="utf-8") as f:
+                first = f.readline()
+        except FileNotFoundError:
+            return time.time()
+        if not first:
+            return time.time()
+        try:
+            return datetime.fromisoformat(json.loads(first)["ts"]).timestamp()
+        except Exception:
+            return 0.0  # pre-JSON log: roll it into a segment on the next write
+
+    def shouldRollover(self, record):
+        if self.max_age and time.time() - self.segment_started >= self.max_age:
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+            self.segment_started = time.time()
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.segment_started = time.time()
+
+def setup_job_logger(log_dir: Path, tz, run_id: str, name: str = "suppy.job") -> logging.Logger:
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+    logger.setLevel(KIND_LEVELS.get(os.getenv("LOG_LEVEL", "DEBUG").strip().upper(), logging.DEBUG))
+    logger.propagate = False
+
+    rotating = SizeAndTimeRotatingHandler(
+        str(Path(log_dir) / "integration-log.jsonl"),
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024))),
+        max_age=float(os.getenv("LOG_ROTATE_HOURS", "24")) * 3600,
+        backup_count=int(os.getenv("LOG_BACKUPS", "10")),
+    )
+    rotating.setFormatter(JsonLineFormatter(tz, run_id))
+    buffered = logging.handlers.MemoryHandler(
+        capacity=max(1, int(os.getenv("LOG_BUFFER_LINES", "200"))),
+        flushLevel=logging.ERROR,
+        target=rotating,
+    )
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(ConsoleFormatter(tz))
+
+    logger.addHandler(buffered)
+    logger.addHandler(console)
+    return logger
@@ -1,6 +1,10 @@
 import os
 import json
 import csv
+import io
+import gzip
+import shutil
+import tempfile
 import requests
 import pandas as pd
 from dotenv import load_dotenv
@@ -10,9 +14,22 @@ from datetime import datetime, timedelta, timezone
 import pytz
 from pathlib import Path
 import traceback
+import time
+from contextlib import contextmanager, nullcontext
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from gspread.utils import rowcol_to_a1
+
+import replay
+import joblog
+from pipeline import Stage, run_pipeline
+import sources
 
 # ================== Setup & ENV ==================
 load_dotenv()
+replay.install_from_env()  # HTTP_RECORD / HTTP_REPLAY_URL (see replay.py)
 
 # Google Sheet
 SHEET_ID   = os.getenv("SHEET_ID")
@@ -35,6 +52,13 @@ DASH_API_KEY       = os.getenv("DASH_API_KEY", "").strip()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
 TELEGRAM_CHAT_ID   = os.getenv("TELEGRAM_CHAT_ID", "").strip()
 
+# Multi-source merge (see sources.py); empty -> single SHEET_ID export
+SOURCES_CONFIG = os.getenv("SOURCES_CONFIG", "").strip()
+
+# Sheet paging
+SHEET_PAGE_ROWS     = max(1, int(os.getenv("SHEET_PAGE_ROWS", "5000")))
+SHEET_FETCH_WORKERS = max(1, int(os.getenv("SHEET_FETCH_WORKERS", "1")))
+
 # CSV knobs
 MI_CSV_HEADER   = os.getenv("MI_CSV_HEADER", "1").strip()
 MI_LINE_ENDING  = os.getenv("MI_LINE_ENDING", "CRLF").strip()
@@ -55,15 +79,11 @@ TZ = pytz.timezone("Asia/Beirut")
 def now_lebanon() -> str:
     return datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
 
-def _append_log(line: str):
-    p = LOGS / "integration-log.txt"
-    with open(p, "a", encoding="utf-8") as f:
-        f.write(line)
+RUN_ID = joblog.new_run_id()
+LOGGER = joblog.setup_job_logger(LOGS, TZ, RUN_ID)
 
 def log_line(kind: str, msg: str):
-    line = f"[{kind}] {now_lebanon()} {msg}\n"
-    _append_log(line)
-    print(line, end="")
+    LOGGER.log(joblog.KIND_LEVELS.get(kind, logging.INFO), msg, extra={"kind": kind})
 
 def send_telegram_message(text: str):
     if not (TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID):
@@ -77,52 +97,154 @@ def send_telegram_message(text: str):
     except Exception:
         pass
 
+# -------- Stage deadlines (see pipeline.py) --------
+def _check_stage(deadline=None, cancel=None):
+    """Raise once the running stage was cancelled or its deadline has passed."""
+    if cancel is not None and cancel.is_set():
+        raise RuntimeError("stage cancelled")
+    if deadline is not None and time.monotonic() >= deadline:
+        raise TimeoutError("stage deadline reached")
+
+def _time_left(cap: float, deadline=None, cancel=None) -> float:
+    """Timeout for the next request: cap, shortened to what is left of the stage."""
+    _check_stage(deadline, cancel)
+    return cap if deadline is None else min(cap, deadline - time.monotonic())
+
 # -------- Dashboard helpers --------
-def post_dashboard_status(status: str, message: str, filename: str = ""):
+DASH_RETRIES        = int(os.getenv("DASH_RETRIES", "3"))
+DASH_MAX_RETRY_WAIT = float(os.getenv("DASH_MAX_RETRY_WAIT", "30"))
+DASH_UPLOAD_COMPRESSION = os.getenv("DASH_UPLOAD_COMPRESSION", "gzip").strip().lower()
+
+def _dashboard_post_worst(timeout: float) -> float:
+    """Longest _dashboard_post() can take: every attempt times out, max waits between."""
+    return (DASH_RETRIES + 1) * timeout + DASH_RETRIES * DASH_MAX_RETRY_WAIT
+
+def _dashboard_post(path: str, make_kwargs, timeout: int, deadline=None, cancel=None):
+    """
+    POST to the dashboard, backing off on 429/503 as told by Retry-After.
+    make_kwargs() is called per attempt so file bodies can be re-opened.
+    Each attempt's timeout is cut to what is left before deadline, and
+    retries stop once cancel is set.
+    """
+    for attempt in range(DASH_RETRIES + 1):
+        with make_kwargs() as kwargs:
+            r = requests.post(f"{DASHBOARD_URL}{path}", timeout=_time_left(timeout, deadline, cancel), **kwargs)
+        if r.status_code not in (429, 503) or attempt == DASH_RETRIES:
+            return r
+        try:
+            wait = float(r.headers.get("Retry-After", "2"))
+        except ValueError:
+            wait = 2.0
+        wait = min(max(wait, 0.5), DASH_MAX_RETRY_WAIT)
+        if deadline is not None and time.monotonic() + wait >= deadline:
+            return r  # no time left for another attempt
+        log_line("WARN", f"{path} HTTP {r.status_code}; retrying in {wait:.1f}s")
+        if cancel is not None:
+            cancel.wait(wait)
+        else:
+            time.sleep(wait)
+    return r
+
+def post_dashboard_status(status: str, message: str, filename: str = "", deadline=None, cancel=None):
     if not DASHBOARD_URL:
         return
     try:
-        headers = {"Content-Type": "application/json"}
+        headers = {"Content-Type": "application/json", "X-Run-Id": RUN_ID}
         if DASH_API_KEY:
             headers["X-API-Key"] = DASH_API_KEY
-        r = requests.post(
-            f"{DASHBOARD_URL}/log",
-            data=json.dumps({"status": status, "message": message, "filename": filename}),
-            headers=headers,
-            timeout=30,
+        body = json.dumps({"status": status, "message": message, "filename": filename, "run_id": RUN_ID})
+        r = _dashboard_post(
+            "/log",
+            lambda: nullcontext({"data": body, "headers": headers}),
+            timeout=30, deadline=deadline, cancel=cancel,
         )
         if r.status_code != 200:
             log_line("WARN", f"/log HTTP {r.status_code}: {r.text[:400]}")
     except Exception as e:
         log_line("WARN", f"/log exception: {e}")
 
-def upload_to_dashboard(csv_path: Path) -> bool:
+def _compressed_payload(csv_path: Path):
+    """
+    Compress the export for upload per DASH_UPLOAD_COMPRESSION (gzip/zstd/none).
+    Returns (upload name, content type, spooled file) or None for a plain upload.
+    zstd needs the optional zstandard package and falls back to gzip without it.
+    """
+    codec = DASH_UPLOAD_COMPRESSION
+    if codec == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            log_line("WARN", "zstandard not installed; compressing dashboard upload with gzip.")
+            codec = "gzip"
+    if codec not in ("gzip", "zstd"):
+        return None
+
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    with open(csv_path, "rb") as src:
+        if codec == "gzip":
+            with gzip.GzipFile(filename=csv_path.name, mode="wb", fileobj=out, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, 1024 * 1024)
+            name, ctype = f"{csv_path.name}.gz", "application/gzip"
+        else:
+            zstandard.ZstdCompressor(level=6).copy_stream(src, out)
+            name, ctype = f"{csv_path.name}.zst", "application/zstd"
+    out.seek(0, os.SEEK_END)
+    log_line("INFO", f"Dashboard upload {codec}: {csv_path.stat().st_size} -> {out.tell()} bytes")
+    out.seek(0)
+    return name, ctype, out
+
+def upload_to_dashboard(csv_path: Path, deadline=None, cancel=None) -> bool:
     if not DASHBOARD_URL:
         log_line("WARN", "DASHBOARD_URL not set; skipping dashboard upload.")
         return False
     try:
-        headers = {}
+        headers = {"X-Run-Id": RUN_ID}
         if DASH_API_KEY:
             headers["X-API-Key"] = DASH_API_KEY
-        with open(csv_path, "rb") as f:
-            r = requests.post(
-                f"{DASHBOARD_URL}/upload",
-                files={"file": (csv_path.name, f, "text/csv")},
-                headers=headers,
-                timeout=120,
-            )
+
+        payload = _compressed_payload(csv_path)
+
+        @contextmanager
+        def upload_kwargs():
+            if payload:
+                name, ctype, body = payload
+                body.seek(0)
+                yield {"files": {"file": (name, body, ctype)}, "headers": headers}
+                return
+            with open(csv_path, "rb") as f:
+                yield {"files": {"file": (csv_path.name, f, "text/csv")}, "headers": headers}
+
+        try:
+            r = _dashboard_post("/upload", upload_kwargs, timeout=120, deadline=deadline, cancel=cancel)
+            if payload and r.status_code in (400, 415):
+                # dashboard that predates compressed uploads: send plain CSV
+                log_line("WARN", f"Compressed upload rejected (HTTP {r.status_code}); retrying as plain CSV.")
+                payload[2].close()
+                payload = None
+                r = _dashboard_post("/upload", upload_kwargs, timeout=120, deadline=deadline, cancel=cancel)
+        finally:
+            if payload:
+                payload[2].close()
         if r.status_code == 200:
-            post_dashboard_status("success", f"Uploaded CSV to dashboard: {csv_path.name}", csv_path.name)
+            post_dashboard_status("success", f"Uploaded CSV to dashboard: {csv_path.name}", csv_path.name,
+                                  deadline=deadline, cancel=cancel)
             return True
         else:
-            post_dashboard_status("failed", f"Dashboard upload HTTP {r.status_code}: {r.text[:800]}", csv_path.name)
+            post_dashboard_status("failed", f"Dashboard upload HTTP {r.status_code}: {r.text[:800]}", csv_path.name,
+                                  deadline=deadline, cancel=cancel)
             return False
     except Exception as e:
-        post_dashboard_status("failed", f"Dashboard upload exception: {e}", csv_path.name)
+        post_dashboard_status("failed", f"Dashboard upload exception: {e}", csv_path.name,
+                              deadline=deadline, cancel=cancel)
         return False
 
-# ================== Google Sheet -> DataFrame ==================
-def download_sheet_as_dataframe() -> pd.DataFrame:
+# ================== Google Sheet -> rows / DataFrame ==================
+# Column C (0-based index 2) is dropped from every export.
+DROP_COL_IDX = 2
+
+def _open_worksheet(sheet_id=None, sheet_name=None):
+    sheet_id = sheet_id or SHEET_ID
+    sheet_name = SHEET_NAME if sheet_name is None else sheet_name
     scope = [
         "https://www.googleapis.com/auth/spreadsheets.readonly",
         "https://www.googleapis.com/auth/drive.readonly",
@@ -133,36 +255,163 @@ def download_sheet_as_dataframe() -> pd.DataFrame:
     credentials = ServiceAccountCredentials.from_json_keyfile_name(str(cred_path), scope)
     gc = gspread.authorize(credentials)
 
-    sh = gc.open_by_key(SHEET_ID)
-    ws = sh.worksheet(SHEET_NAME) if SHEET_NAME else sh.sheet1
-    values = ws.get_all_values()
-    if not values:
-        raise RuntimeError("Google Sheet is empty.")
+    sh = gc.open_by_key(sheet_id)
+    return sh.worksheet(sheet_name) if sheet_name else sh.sheet1
 
-    headers = values[0]
-    rows    = values[1:]
-    c_idx = 2
-    if len(headers) <= c_idx:
+def _column_spans(keep):
+    """1-based inclusive (first, last) spans covering the 0-based column indices in keep."""
+    spans = []
+    for idx in sorted(set(keep)):
+        col = idx + 1
+        if spans and spans[-1][1] == col - 1:
+            spans[-1] = (spans[-1][0], col)
+        else:
+            spans.append((col, col))
+    return spans
+
+def _fetch_sheet_page(ws, spans, first_row: int, last_row: int):
+    """
+    Read rows first_row..last_row (1-based, inclusive) for the kept column spans
+    in a single batched request. Returns the rows the API sent back, each padded
+    to the kept width; trailing all-empty rows are omitted (same as the API).
+    """
+    ranges = [
+        f"{rowcol_to_a1(first_row, c0)}:{rowcol_to_a1(last_row, c1)}"
+        for c0, c1 in spans
+    ]
+    parts = ws.batch_get(ranges)
+    n = max((len(p) for p in parts), default=0)
+    rows = []
+    for i in range(n):
+        row = []
+        for (c0, c1), part in zip(spans, parts):
+            width = c1 - c0 + 1
+            cells = list(part[i]) if i < len(part) else []
+            row.extend(cells[:width] + [""] * (width - len(cells)))
+        rows.append(row)
+    return rows
+
+def iter_sheet_rows(ws, n_cols: int, drop_idx: int = DROP_COL_IDX, keep=None):
+    """
+    Yield data rows (row 2 onwards) with column drop_idx removed (or only the
+    0-based columns in keep, when given), paging through
+    the sheet SHEET_PAGE_ROWS rows at a time. With SHEET_FETCH_WORKERS > 1 up to
+    that many pages are in flight at once; rows are still yielded in sheet order
+    and at most workers+1 pages are held in memory.
+
+    Each row is padded to the kept width. Blank rows between data are kept and
+    trailing blank rows are dropped, as ws.get_all_values() does, judged on the
+    fetched columns only (a row with data solely outside keep counts as blank).
+    """
+    if keep is None:
+        keep = [i for i in range(n_cols) if i != drop_idx]
+    spans = _column_spans(keep)
+    total = ws.row_count
+    starts = list(range(2, total + 1, SHEET_PAGE_ROWS))
+
+    def fetch(first_row):
+        last_row = min(first_row + SHEET_PAGE_ROWS - 1, total)
+        return last_row - first_row + 1, _fetch_sheet_page(ws, spans, first_row, last_row)
+
+    def pages():
+        if SHEET_FETCH_WORKERS <= 1:
+            for first_row in starts:
+                yield fetch(first_row)
+            return
+        with ThreadPoolExecutor(max_workers=SHEET_FETCH_WORKERS) as pool:
+            pending = deque()
+            it = iter(starts)
+            for first_row in islice(it, SHEET_FETCH_WORKERS):
+                pending.append(pool.submit(fetch, first_row))
+            while pending:
+                page = pending.popleft().result()
+                nxt = next(it, None)
+                if nxt is not None:
+                    pending.append(pool.submit(fetch, nxt))
+                yield page
+
+    blank = [""] * sum(c1 - c0 + 1 for c0, c1 in spans)
+    held_blanks = 0
+    for window, rows in pages():
+        if rows:
+            for _ in range(held_blanks):
+                yield list(blank)
+            held_blanks = 0
+            yield from rows
+        held_blanks += window - len(rows)
+
+def _spool_rows(rows):
+    """
+    Buffer rows (trailing empty cells trimmed) in a temp file to find the
+    widest one. Returns (width, spool file rewound for csv.reader).
+    """
+    spool = tempfile.TemporaryFile("w+", encoding="utf-8", newline="")
+    try:
+        w = csv.writer(spool)
+        width = 0
+        for r in rows:
+            n = len(r)
+            while n and r[n - 1] == "":
+                n -= 1
+            w.writerow(r[:n])
+            width = max(width, n)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return width, spool
+
+def open_sheet_rows():
+    """
+    Return (headers, row iterator) for the configured sheet, column C dropped,
+    in the shape ws.get_all_values() gave: every column is fetched (C too, so a
+    row whose only value is in C survives as a blank row), and the headers and
+    rows are padded to the widest row, including data past the last header.
+    The rows are spooled to a temp file first, since the width is only known
+    once the whole sheet has been read.
+    """
+    ws = _open_worksheet()
+    headers = ws.row_values(1)
+    n_cols = max(ws.col_count, len(headers))
+    width, spool = _spool_rows(iter_sheet_rows(ws, n_cols, keep=range(n_cols)))
+    width = max(width, len(headers))
+    if not width:
+        spool.close()
+        raise RuntimeError("Google Sheet is empty.")
+    headers = headers + [""] * (width - len(headers))
+    if len(headers) <= DROP_COL_IDX:
+        spool.close()
         raise RuntimeError(f"Sheet has no column C. Headers: {headers}")
 
-    norm_rows = []
-    for r in rows:
-        if len(r) < len(headers):
-            r = r + [""] * (len(headers) - len(r))
-        elif len(r) > len(headers):
-            r = r[:len(headers)]
-        norm_rows.append(r)
+    out_headers = headers[:DROP_COL_IDX] + headers[DROP_COL_IDX+1:]
+    b_idx = out_headers.index("Barcodes") if "Barcodes" in out_headers else None
+
+    def _shape():
+        with spool:
+            for r in csv.reader(spool):
+                r = r + [""] * (width - len(r))
+                r = r[:DROP_COL_IDX] + r[DROP_COL_IDX+1:]
+                if b_idx is not None:
+                    r[b_idx] = r[b_idx].strip()
+                yield r
+
+    return out_headers, _shape()
+
+def _read_sheet_source(spec, wanted) -> pd.DataFrame:
+    """Sheet reader for sources.py: page through only the wanted columns."""
+    ws = _open_worksheet(spec.get("sheet_id"), spec.get("worksheet", ""))
+    headers = ws.row_values(1)
+    if not headers:
+        raise RuntimeError(f"Google Sheet for source {spec['name']!r} is empty.")
+    keep = [i for i, h in enumerate(headers) if wanted is None or h in wanted]
+    rows = iter_sheet_rows(ws, len(headers), keep=keep)
+    return pd.DataFrame(list(rows), columns=[headers[i] for i in keep])
 
-    out_headers  = headers[:c_idx] + headers[c_idx+1:]
-    out_rows     = [r[:c_idx] + r[c_idx+1:] for r in norm_rows]
-
-    df = pd.DataFrame(out_rows, columns=out_headers)
+def download_sheet_as_dataframe() -> pd.DataFrame:
+    headers, rows = open_sheet_rows()
+    df = pd.DataFrame(list(rows), columns=headers)
     if df.empty:
         raise RuntimeError("After dropping column C, dataframe is empty.")
-
-    if "Barcodes" in df.columns:
-        df["Barcodes"] = df["Barcodes"].astype(str).str.strip()
-
     return df
 
 def _quoting_mode():
@@ -173,10 +422,13 @@ def _quoting_mode():
         "NONE": csv.QUOTE_NONE,
     }.get(MI_QUOTING.upper(), csv.QUOTE_ALL)
 
-def write_csv(df: pd.DataFrame) -> Path:
+def _export_path() -> Path:
     stamp = datetime.now(TZ).strftime("%Y%m%d_%H%M%S")
     name  = f"{(SHEET_NAME or 'Local').replace(' ','_')}_{stamp}.csv"
-    path  = EXPORTS / name
+    return EXPORTS / name
+
+def write_csv(df: pd.DataFrame) -> Path:
+    path = _export_path()
 
     include_header = MI_CSV_HEADER == "1"
     lineterm = "\r\n" if MI_LINE_ENDING.upper() == "CRLF" else "\n"
@@ -193,17 +445,56 @@ def write_csv(df: pd.DataFrame) -> Path:
     )
 
     log_line("INFO",  f"CSV rows: {len(df)}")
-    try:
-        with open(path, "r", encoding="utf-8", newline="") as f:
-            first = f.readline().rstrip("\r\n")
-            second = f.readline().rstrip("\r\n")
-        log_line("DEBUG", f"CSV first line: {first}")
-        log_line("DEBUG", f"CSV second line: {second}")
-    except Exception:
-        pass
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        head = df.head(1 if include_header else 2).to_csv(
+            index=False, header=include_header, lineterminator="\n", quoting=quoting, sep=MI_SEP,
+        ).split("\n")
+        log_line("DEBUG", f"CSV first line: {head[0]}")
+        log_line("DEBUG", f"CSV second line: {head[1] if len(head) > 1 else ''}")
 
     return path
 
+def write_csv_rows(headers, rows):
+    """
+    Stream rows straight into the export CSV (same knobs as write_csv) without
+    building a DataFrame. Returns (path, row_count). Raises if no rows came in.
+    """
+    path = _export_path()
+
+    include_header = MI_CSV_HEADER == "1"
+    lineterm = "\r\n" if MI_LINE_ENDING.upper() == "CRLF" else "\n"
+    quoting = _quoting_mode()
+
+    count = 0
+    preview = []
+    try:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f, delimiter=MI_SEP, quoting=quoting, lineterminator=lineterm)
+            if include_header:
+                w.writerow(headers)
+                preview.append(headers)
+            for r in rows:
+                w.writerow(r)
+                if len(preview) < 2:
+                    preview.append(r)
+                count += 1
+    except BaseException:
+        # a failed page read must not leave a truncated export behind
+        path.unlink(missing_ok=True)
+        raise
+
+    if count == 0:
+        path.unlink(missing_ok=True)
+        raise RuntimeError("After dropping column C, dataframe is empty.")
+
+    log_line("INFO",  f"CSV rows: {count}")
+    for label, r in zip(("first", "second"), preview if LOGGER.isEnabledFor(logging.DEBUG) else []):
+        buf = io.StringIO()
+        csv.writer(buf, delimiter=MI_SEP, quoting=quoting, lineterminator="").writerow(r)
+        log_line("DEBUG", f"CSV {label} line: {buf.getvalue()}")
+
+    return path, count
+
 # ================== Suppy Auth (auto; self-healing) ==================
 def _load_cached_token() -> str:
     if TOKEN_FILE.exists():
@@ -221,13 +512,13 @@ def _save_cached_token(token: str, ttl_hours: int = 12):
     exp = datetime.now(timezone.utc) + timedelta(hours=ttl_hours)
     TOKEN_FILE.write_text(json.dumps({"token": token, "expires_at": exp.isoformat()}), encoding="utf-8")
 
-def _login_and_get_token() -> str:
+def _login_and_get_token(deadline=None, cancel=None) -> str:
     if not (SUPPY_EMAIL and SUPPY_PASSWORD):
         raise RuntimeError("Suppy credentials missing. Set SUPPY_EMAIL and SUPPY_PASSWORD in .env.")
     resp = requests.post(
         SUPPY_AUTH_URL,
         json={"username": SUPPY_EMAIL, "password": SUPPY_PASSWORD},
-        timeout=60,
+        timeout=_time_left(60, deadline, cancel),
     )
     if resp.status_code != 200:
         raise RuntimeError(f"Auth HTTP {resp.status_code}: {resp.text[:800]}")
@@ -249,14 +540,17 @@ def _login_and_get_token() -> str:
     _save_cached_token(token)
     return token
 
-def get_suppy_token() -> str:
+def get_suppy_token(deadline=None, cancel=None) -> str:
     cached = _load_cached_token()
     if cached:
         return cached
-    return _login_and_get_token()
+    return _login_and_get_token(deadline, cancel)
 
 # ================== MI Upload ==================
-def upload_to_suppy_mi(csv_path: Path) -> dict:
+# login + post, then a re-login + post after a 401
+MI_UPLOAD_WORST = 2 * (60 + 120)
+
+def upload_to_suppy_mi(csv_path: Path, deadline=None, cancel=None) -> dict:
     if not (BRANCH_ID and PARTNER_ID):
         raise RuntimeError("BRANCH_ID or PARTNER_ID missing; cannot upload to Suppy MI.")
     def do_post(token: str):
@@ -266,13 +560,14 @@ def upload_to_suppy_mi(csv_path: Path) -> dict:
             headers["Authorization"] = f"Bearer {token}"
         with open(csv_path, "rb") as f:
             files = {"file": (csv_path.name, f, "text/csv")}
-            return requests.post(SUPPY_MI_URL, headers=headers, data=data, files=files, timeout=120)
+            return requests.post(SUPPY_MI_URL, headers=headers, data=data, files=files,
+                                 timeout=_time_left(120, deadline, cancel))
 
-    token = get_suppy_token()
+    token = get_suppy_token(deadline, cancel)
     resp = do_post(token)
     if resp.status_code == 401:
         log_line("WARN", "MI returned 401. Re-authenticating and retrying once.")
-        token = _login_and_get_token()
+        token = _login_and_get_token(deadline, cancel)
         resp = do_post(token)
 
     # surface non-200s
@@ -287,39 +582,111 @@ def upload_to_suppy_mi(csv_path: Path) -> dict:
         log_line("WARN", f"Suppy MI returned non-JSON body: {raw[:800]}")
         return {"chunks": [raw]}
 
+# ================== Pipeline ==================
+# Stage timeouts / overall budget in seconds (see pipeline.py). The upload
+# defaults cover the worst case of the calls they wrap (every attempt timing
+# out, maximum Retry-After waits), so a slow upload that would still succeed
+# is not cut short; stages pass what is left of their timeout down into the
+# request timeouts.
+STAGE_TIMEOUT_EXPORT    = float(os.getenv("STAGE_TIMEOUT_EXPORT", "600"))
+STAGE_TIMEOUT_DASHBOARD = float(os.getenv(
+    "STAGE_TIMEOUT_DASHBOARD",
+    # compressed upload, plain-CSV fallback, then the status post
+    str(2 * _dashboard_post_worst(120) + _dashboard_post_worst(30)),
+))
+STAGE_TIMEOUT_MI        = float(os.getenv("STAGE_TIMEOUT_MI", str(MI_UPLOAD_WORST)))
+PIPELINE_BUDGET         = float(os.getenv(
+    "PIPELINE_BUDGET", str(STAGE_TIMEOUT_EXPORT + max(STAGE_TIMEOUT_DASHBOARD, STAGE_TIMEOUT_MI)),
+))
+
+def _until_deadline(rows, deadline, cancel):
+    """Pass rows through, stopping the export once the stage runs out of time."""
+    for i, r in enumerate(rows):
+        if i % 1000 == 0:
+            _check_stage(deadline, cancel)
+        yield r
+
+def _stage_export(inputs, cancel, deadline):
+    if SOURCES_CONFIG:
+        config = sources.load_config(SOURCES_CONFIG)
+        df = sources.load_merged(config, _read_sheet_source)
+        log_line("INFO", f"Merged {len(config['sources'])} sources: {list(df.columns)} | Rows: {len(df)}")
+        _check_stage(deadline, cancel)
+        csv_path = write_csv(df)
+        log_line("INFO", f"CSV written: {csv_path.name} | Rows: {len(df)}")
+        return csv_path, len(df)
+
+    # rows are streamed page by page from the sheet into the CSV
+    headers, rows = open_sheet_rows()
+    log_line("INFO", f"Columns after drop-C: {headers}")
+    csv_path, n_rows = write_csv_rows(headers, _until_deadline(rows, deadline, cancel))
+    log_line("INFO", f"CSV written: {csv_path.name} | Rows: {n_rows}")
+    return csv_path, n_rows
+
+def _stage_dashboard(inputs, cancel, deadline):
+    csv_path, _ = inputs["export"]
+    uploaded = upload_to_dashboard(csv_path, deadline, cancel)
+    if not uploaded:
+        log_line("WARN", "Dashboard upload did not return 200. Check DASHBOARD_URL / DASH_API_KEY.")
+    return uploaded
+
+def _stage_mi(inputs, cancel, deadline):
+    csv_path, _ = inputs["export"]
+    if not BRANCH_ID:
+        raise RuntimeError("BRANCH_ID is empty; Suppy MI will reject. Set BRANCH_ID.")
+    mi_body = upload_to_suppy_mi(csv_path, deadline, cancel)
+    log_line("INFO", f"Suppy MI response: {json.dumps(mi_body)[:1200]}")
+    return mi_body
+
+def build_stages():
+    # the two uploads only need the export, so they run side by side
+    return [
+        Stage("export", _stage_export, timeout=STAGE_TIMEOUT_EXPORT),
+        Stage("dashboard", _stage_dashboard, needs=["export"], timeout=STAGE_TIMEOUT_DASHBOARD),
+        Stage("mi", _stage_mi, needs=["export"], timeout=STAGE_TIMEOUT_MI),
+    ]
+
+def _stage_error(res) -> str:
+    """Error message for a stage that did not finish OK."""
+    if res["exc"] is not None:
+        return str(res["exc"])
+    return f"{res['name']} stage {res['status']}: {res['error'] or res['status']}"
+
+def _log_stage(res):
+    if res["status"] == "failed":
+        log_line("ERROR", f"Stage {res['name']}: failed in {res['elapsed_ms']} ms\n{res['error']}")
+        return
+    kind = "INFO" if res["status"] in ("ok", "skipped") else "WARN"
+    extra = f" ({res['error']})" if res["status"] != "ok" else ""
+    log_line(kind, f"Stage {res['name']}: {res['status']} in {res['elapsed_ms']} ms{extra}")
+
 # ================== Main ==================
 if __name__ == "__main__":
     try:
-        log_line("INFO", "Job started.")
+        log_line("INFO", f"Job started. run_id={RUN_ID}")
         post_dashboard_status("info", "Job started")
 
-        # 1) Fetch data
-        df = download_sheet_as_dataframe()
-        log_line("INFO", f"Columns after drop-C: {list(df.columns)} | Rows: {len(df)}")
+        results = run_pipeline(build_stages(), budget=PIPELINE_BUDGET, on_done=_log_stage)
 
-        # 2) Write CSV
-        csv_path = write_csv(df)
-        log_line("INFO", f"CSV written: {csv_path.name}")
+        export = results["export"]
+        if export["exc"] is not None:
+            raise export["exc"]  # keeps the sheet/CSV traceback for the log below
+        if export["status"] != "ok":
+            raise RuntimeError(_stage_error(export))
+        csv_path, n_rows = export["value"]
 
-        # 3) Upload to DASHBOARD FIRST (so Files shows even if Suppy fails)
-        uploaded = upload_to_dashboard(csv_path)
-        if not uploaded:
-            log_line("WARN", "Dashboard upload did not return 200. Check DASHBOARD_URL / DASH_API_KEY.")
-
-        # 4) Upload to Suppy MI (best effort)
-        try:
-            if not BRANCH_ID:
-                raise RuntimeError("BRANCH_ID is empty; Suppy MI will reject. Set BRANCH_ID.")
-            mi_body = upload_to_suppy_mi(csv_path)
-            log_line("INFO", f"Suppy MI response: {json.dumps(mi_body)[:1200]}")
+        # Suppy MI is best effort: report it, do not fail the run
+        # (posted here, so a stage the run gave up on can never report OK late)
+        mi = results["mi"]
+        if mi["status"] == "ok":
             post_dashboard_status("success", "Suppy MI upload OK", csv_path.name)
-        except Exception as e:
-            msg = f"Suppy MI upload failed: {e}"
+        else:
+            msg = f"Suppy MI upload failed: {_stage_error(mi)}"
             log_line("ERROR", msg)
             post_dashboard_status("failed", msg, csv_path.name)
 
-        # 5) Done
-        msg = f"✅ Completed. File: {csv_path.name} • Rows: {len(df)}"
+        # Done
+        msg = f"✅ Completed. File: {csv_path.name} • Rows: {n_rows}"
         send_telegram_message(msg)
         log_line("SUCCESS", msg)
         post_dashboard_status("success", msg, csv_path.name)
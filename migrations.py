@@ -0,0 +1,112 @@
+"""
+Versioned schema migrations for the dashboard database.
+
+Each migration runs once, in order, inside a single write transaction, and the
+applied version is kept in the schema_version table. Run them (plus the admin
+reset) with:
+
+    python app.py bootstrap
+
+Workers only check the version on first DB use and apply anything pending, so
+an out-of-date database still works without the bootstrap step.
+"""
+from sqlalchemy import text
+
+# (version, description, statements) -- append only, never edit a shipped one
+MIGRATIONS = [
+    (1, "users and news", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            position TEXT,
+            role TEXT NOT NULL DEFAULT 'viewer',
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS news (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            body_md TEXT NOT NULL,
+            html TEXT NOT NULL,
+            published INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            author_id INTEGER
+        )
+        """,
+    ]),
+    (2, "api keys and usage counters", [
+        """
+        CREATE TABLE IF NOT EXISTS api_keys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            key_hash TEXT UNIQUE NOT NULL,
+            rate_per_min INTEGER NOT NULL DEFAULT 60,
+            burst INTEGER NOT NULL DEFAULT 20,
+            max_uploads INTEGER NOT NULL DEFAULT 2,
+            created_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS api_usage (
+            principal TEXT PRIMARY KEY,
+            requests INTEGER NOT NULL DEFAULT 0,
+            uploads INTEGER NOT NULL DEFAULT 0,
+            bytes_in INTEGER NOT NULL DEFAULT 0,
+            throttled INTEGER NOT NULL DEFAULT 0,
+            shed INTEGER NOT NULL DEFAULT 0,
+            last_seen TEXT
+        )
+        """,
+    ]),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+def current_version(engine) -> int:
+    with engine.connect() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_version'"
+        )).fetchone()
+        if not exists:
+            return 0
+        row = conn.execute(text("SELECT MAX(version) FROM schema_version")).fetchone()
+    return row[0] or 0
+
+def migrate(engine, log=print) -> int:
+    """Apply pending migrations; returns the resulting version."""
+    if current_version(engine) >= LATEST:
+        return LATEST
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent workers
+        # queue here and then see the migrations as already applied.
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            conn.exec_driver_sql("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            version = conn.exec_driver_sql("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+            for num, desc, statements in MIGRATIONS:
+                if num <= version:
+                    continue
+                for stmt in statements:
+                    conn.exec_driver_sql(stmt)
+                conn.execute(text(
+                    "INSERT INTO schema_version (version, description) VALUES (:v, :d)"
+                ), {"v": num, "d": desc})
+                log(f"[MIGRATE] Applied {num}: {desc}")
+                version = num
+            conn.exec_driver_sql("COMMIT")
+        except Exception:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+    return version
@@ -0,0 +1,157 @@
+"""
+Small dependency-graph executor for the sync job.
+
+A Stage runs once all of its `needs` have finished OK; stages whose needs are
+met run concurrently, each on its own daemon thread. Every stage gets a
+timeout (capped by what is left of the run's overall budget).
+
+Each stage's fn is called as fn(inputs, cancel, deadline):
+    inputs    maps each needed stage name to its return value
+    cancel    threading.Event set when the stage should stop (its deadline
+              passed, or the run budget ran out); check it between attempts
+    deadline  time.monotonic() value the stage must finish by, or None; pass
+              what is left of it down into request timeouts and retry waits
+
+A stage still running `grace` seconds past its deadline is reported as
+"timeout" and abandoned (threads cannot be killed). Before returning, run_pipeline() gives abandoned stages another
+`grace` seconds to wind down so the process does not exit mid-request.
+
+A failed, timed-out or skipped stage marks everything that needs it as
+"skipped". When the budget runs out, stages that have not started are
+"cancelled". A dependency cycle is rejected with ValueError up front. run_pipeline() returns one result dict per stage:
+    {"name", "status", "value", "error", "exc", "started_at", "elapsed_ms"}
+with status in ok / failed / timeout / skipped / cancelled. For a failed
+stage, error holds the full traceback and exc the exception it raised.
+"""
+import time
+import queue
+import threading
+import traceback
+
+class Stage:
+    def __init__(self, name, fn, needs=(), timeout=None):
+        self.name = name
+        self.fn = fn
+        self.needs = tuple(needs)
+        self.timeout = timeout
+
+def _result(name, status, value=None, error="", exc=None, started_at=None, elapsed_ms=0):
+    return {"name": name, "status": status, "value": value, "error": error, "exc": exc,
+            "started_at": started_at, "elapsed_ms": elapsed_ms}
+
+def _check_acyclic(stages):
+    state = {}  # name -> "visiting" / "done"
+    by_name = {s.name: s for s in stages}
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            cycle = path[path.index(name):] + [name]
+            raise ValueError(f"Stage dependency cycle: {' -> '.join(cycle)}")
+        state[name] = "visiting"
+        for dep in by_name[name].needs:
+            visit(dep, path + [name])
+        state[name] = "done"
+
+    for s in stages:
+        visit(s.name, [])
+
+def run_pipeline(stages, budget=None, on_done=None, grace=30.0):
+    """
+    Run stages respecting their needs. budget is the wall-clock cap in seconds
+    for the whole run; on_done(result) is called as each stage settles.
+    Returns {name: result} in stage declaration order.
+    """
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        for dep in s.needs:
+            if dep not in by_name:
+                raise ValueError(f"Stage {s.name!r} needs unknown stage {dep!r}")
+    _check_acyclic(stages)
+
+    started = time.monotonic()
+    deadline = started + budget if budget else None
+    done_q = queue.Queue()
+    results = {}
+    running = {}    # name -> (started monotonic, stage deadline, cancel event)
+    abandoned = []  # threads of stages reported as timed out
+    threads = {}
+
+    def settle(res):
+        results[res["name"]] = res
+        if on_done:
+            on_done(res)
+
+    def launch(stage):
+        inputs = {dep: results[dep]["value"] for dep in stage.needs}
+        now = time.monotonic()
+        limit = stage.timeout
+        if deadline is not None:
+            left = deadline - now
+            limit = left if limit is None else min(limit, left)
+        stage_deadline = now + limit if limit is not None else None
+        cancel = threading.Event()
+        running[stage.name] = (now, stage_deadline, cancel)
+
+        def work():
+            try:
+                value = stage.fn(inputs, cancel, stage_deadline)
+                done_q.put((stage.name, "ok", value, "", None))
+            except Exception as e:
+                done_q.put((stage.name, "failed", None, traceback.format_exc(), e))
+
+        t = threading.Thread(target=work, name=f"stage-{stage.name}", daemon=True)
+        threads[stage.name] = t
+        t.start()
+
+    def schedule():
+        for s in stages:
+            if s.name in results or s.name in running:
+                continue
+            dep_status = [results.get(d, {}).get("status") for d in s.needs]
+            if any(st is not None and st != "ok" for st in dep_status):
+                bad = [d for d in s.needs if results.get(d, {}).get("status") not in (None, "ok")]
+                settle(_result(s.name, "skipped", error=f"needs {', '.join(bad)}"))
+                continue
+            if all(st == "ok" for st in dep_status):
+                launch(s)
+
+    schedule()
+    while running:
+        now = time.monotonic()
+        # wake at the next stage deadline (to set its cancel event) or, once
+        # set, at deadline + grace (to give up on it)
+        waits = [t if not c.is_set() else t + grace for _, t, c in running.values() if t is not None]
+        wait = max(0.0, min(waits) - now) if waits else None
+        try:
+            name, status, value, error, exc = done_q.get(timeout=wait)
+        except queue.Empty:
+            now = time.monotonic()
+            for n, (t0, t_end, cancel) in list(running.items()):
+                if t_end is None or now < t_end:
+                    continue
+                cancel.set()
+                if now >= t_end + grace:
+                    del running[n]
+                    abandoned.append(threads[n])
+                    settle(_result(n, "timeout", error="stage timed out",
+                                   started_at=t0 - started, elapsed_ms=int((now - t0) * 1000)))
+        else:
+            if name not in running:
+                continue  # already reported as timed out
+            t0, _, _ = running.pop(name)
+            settle(_result(name, status, value, error, exc, started_at=t0 - started,
+                           elapsed_ms=int((time.monotonic() - t0) * 1000)))
+
+        if deadline is not None and time.monotonic() >= deadline:
+            for _, _, cancel in running.values():
+                cancel.set()
+            for s in stages:
+                if s.name not in results and s.name not in running:
+                    settle(_result(s.name, "cancelled", error="run budget exhausted"))
+        schedule()
+
+    for t in abandoned:
+        t.join(grace)
+    return {s.name: results[s.name] for s in stages}
@@ -0,0 +1,368 @@
+"""
+HTTP record/replay harness for the sync job (main.py).
+
+Record: run the job with HTTP_RECORD=cassettes/run.jsonl and every HTTP
+exchange made through `requests` (Google Sheets + OAuth token, Suppy login/MI,
+dashboard /upload and /log, Telegram) is appended to that file. Auth headers,
+credentials in request bodies, tokens in JSON responses and the Telegram bot
+token in URL paths are redacted.
+
+Replay: start the stub server on a cassette, then run the job with
+HTTP_REPLAY_URL pointing at it. All outgoing requests are redirected to the
+stub, which answers from the recording:
+
+    python replay.py serve cassettes/run.jsonl --port 8765 \\
+        --latency-ms 150 --jitter-ms 50 --error-rate 0.02 \\
+        --inject-401 0.1 --inject-429 0.05 --inject-path /api/manual-integration
+    HTTP_REPLAY_URL=http://127.0.0.1:8765 python main.py
+
+`python replay.py fake-credentials credentials.json` writes a throwaway
+service-account file so the Google client can sign its (replayed) token
+request on a machine without real credentials.
+"""
+import os
+import re
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+REPLAY_HOST_HEADER = "X-Replay-Host"
+STATS_PATH = "/__replay__/stats"
+
+# Never written to a cassette.
+REDACT_HEADERS = {"authorization", "x-api-key", "cookie", "set-cookie"}
+REDACT_FIELDS = ("password", "assertion", "client_secret")
+# Auth tokens in JSON response bodies (Suppy login, Google OAuth); replay only
+# needs a non-empty value, so they are recorded as a placeholder.
+REDACT_RESPONSE_FIELDS = {"token", "access_token", "accessToken", "id_token", "refresh_token"}
+REDACTED_TOKEN = "redacted-token"
+# Telegram carries the bot token in the URL path: /bot<TOKEN>/sendMessage
+_BOT_PATH = re.compile(r"^/bot[^/]+/")
+
+def _redact_path(path: str) -> str:
+    return _BOT_PATH.sub(f"/bot{REDACTED_TOKEN}/", path)
+
+_original_send = requests.Session.send
+_installed = None
+
+# ================== Client side ==================
+def _encode_body(raw: bytes) -> dict:
+    if not raw:
+        return {"body": ""}
+    try:
+        return {"body": raw.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(raw).decode("ascii")}
+
+def _decode_body(entry: dict) -> bytes:
+    if "body_b64" in entry:
+        return base64.b64decode(entry["body_b64"])
+    return (entry.get("body") or "").encode("utf-8")
+
+def _redact_request_body(body) -> str:
+    if body is None:
+        return ""
+    if isinstance(body, bytes):
+        if b"Content-Disposition: form-data" in body[:4096]:
+            return f"<multipart {len(body)} bytes>"
+        try:
+            body = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return f"<binary {len(body)} bytes>"
+    if not isinstance(body, str):
+        return f"<stream {type(body).__name__}>"
+    for field in REDACT_FIELDS:
+        body = re.sub(rf'("{field}"\s*:\s*")[^"]*(")', r"\1***\2", body)
+        body = re.sub(rf"({field}=)[^&]*", r"\1***", body)
+    return body[:4000]
+
+def _redact_tokens(value):
+    """Copy of a parsed JSON value with REDACT_RESPONSE_FIELDS replaced; (value, changed)."""
+    if isinstance(value, dict):
+        out, changed = {}, False
+        for k, v in value.items():
+            if k in REDACT_RESPONSE_FIELDS and isinstance(v, str) and v:
+                out[k], c = REDACTED_TOKEN, True
+            else:
+                out[k], c = _redact_tokens(v)
+            changed = changed or c
+        return out, changed
+    if isinstance(value, list):
+        items = [_redact_tokens(v) for v in value]
+        return [v for v, _ in items], any(c for _, c in items)
+    return value, False
+
+def _redact_response_body(raw: bytes) -> bytes:
+    if not raw or raw.lstrip()[:1] not in (b"{", b"["):
+        return raw
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return raw
+    data, changed = _redact_tokens(data)
+    return json.dumps(data, ensure_ascii=False).encode("utf-8") if changed else raw
+
+class _Recorder:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def send(self, session, prep, **kwargs):
+        started = time.monotonic()
+        resp = _original_send(session, prep, **kwargs)
+        raw = resp.content
+        parts = urlsplit(prep.url)
+        entry = {
+            "method": prep.method,
+            "host": parts.netloc,
+            "path": _redact_path(parts.path),
+            "query": parts.query,
+            "request_body": _redact_request_body(prep.body),
+            "status": resp.status_code,
+            "headers": {
+                k: v for k, v in resp.headers.items()
+                if k.lower() not in REDACT_HEADERS
+                and k.lower() not in ("content-length", "content-encoding", "transfer-encoding", "connection")
+            },
+            "elapsed_ms": int((time.monotonic() - started) * 1000),
+            **_encode_body(_redact_response_body(raw)),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return resp
+
+class _Redirector:
+    def __init__(self, base_url: str):
+        self.base = urlsplit(base_url.rstrip("/"))
+
+    def send(self, session, prep, **kwargs):
+        parts = urlsplit(prep.url)
+        if parts.netloc != self.base.netloc:
+            prep.headers[REPLAY_HOST_HEADER] = parts.netloc
+            prep.url = urlunsplit((self.base.scheme, self.base.netloc, parts.path, parts.query, ""))
+        return _original_send(session, prep, **kwargs)
+
+def install(record_path: str = "", replay_url: str = ""):
+    """Patch requests.Session.send for recording or redirecting to a stub."""
+    global _installed
+    if replay_url:
+        hook = _Redirector(replay_url)
+    elif record_path:
+        hook = _Recorder(record_path)
+    else:
+        return None
+
+    def send(session, prep, **kwargs):
+        return hook.send(session, prep, **kwargs)
+
+    requests.Session.send = send
+    _installed = hook
+    return hook
+
+def uninstall():
+    global _installed
+    requests.Session.send = _original_send
+    _installed = None
+
+def install_from_env():
+    """Activate from HTTP_REPLAY_URL / HTTP_RECORD (replay wins if both are set)."""
+    return install(
+        record_path=os.getenv("HTTP_RECORD", "").strip(),
+        replay_url=os.getenv("HTTP_REPLAY_URL", "").strip(),
+    )
+
+# ================== Stub server ==================
+class Cassette:
+    """
+    Recorded responses keyed by request. Exact (method, host, path, query)
+    matches are served first, then (method, host, path). Each key replays its
+    responses in order and keeps repeating the last one.
+    """
+    def __init__(self, entries):
+        self.lock = threading.Lock()
+        self.exact = defaultdict(deque)
+        self.loose = defaultdict(deque)
+        for e in entries:
+            self.exact[(e["method"], e["host"], e["path"], e.get("query", ""))].append(e)
+            self.loose[(e["method"], e["host"], e["path"])].append(e)
+
+    @classmethod
+    def load(cls, path: str):
+        entries = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+        return cls(entries)
+
+    def _take(self, q):
+        if not q:
+            return None
+        return q.popleft() if len(q) > 1 else q[0]
+
+    def match(self, method, host, path, query):
+        with self.lock:
+            hit = self._take(self.exact.get((method, host, path, query)))
+            if hit is None:
+                hit = self._take(self.loose.get((method, host, path)))
+            return hit
+
+class StubConfig:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 inject_401=0.0, inject_429=0.0, retry_after=1, inject_path=""):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.inject_401 = inject_401
+        self.inject_429 = inject_429
+        self.retry_after = retry_after
+        self.inject_path = re.compile(inject_path) if inject_path else None
+
+def make_handler(cassette: Cassette, cfg: StubConfig):
+    stats = defaultdict(int)
+    stats_lock = threading.Lock()
+
+    def bump(key):
+        with stats_lock:
+            stats[key] += 1
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            sys.stderr.write(f"[STUB] {self.command} {self.path} - {fmt % args}\n")
+
+        def _reply(self, status, body=b"", headers=None):
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            parts = urlsplit(self.path)
+            if parts.path == STATS_PATH:
+                with stats_lock:
+                    body = json.dumps(dict(stats)).encode("utf-8")
+                return self._reply(200, body, {"Content-Type": "application/json"})
+
+            host = self.headers.get(REPLAY_HOST_HEADER) or self.headers.get("Host", "")
+            bump("requests")
+
+            delay = cfg.latency_ms + (random.uniform(0, cfg.jitter_ms) if cfg.jitter_ms else 0)
+            if delay:
+                time.sleep(delay / 1000.0)
+
+            injectable = cfg.inject_path is None or cfg.inject_path.search(parts.path)
+            roll = random.random()
+            if injectable and roll < cfg.inject_401:
+                bump("injected_401")
+                return self._reply(401, b'{"error":"unauthorized (injected)"}',
+                                   {"Content-Type": "application/json"})
+            roll -= cfg.inject_401
+            if injectable and roll < cfg.inject_429:
+                bump("injected_429")
+                return self._reply(429, b'{"error":"rate limited (injected)"}',
+                                   {"Content-Type": "application/json",
+                                    "Retry-After": str(cfg.retry_after)})
+            roll -= cfg.inject_429
+            if injectable and roll < cfg.error_rate:
+                bump("injected_5xx")
+                return self._reply(503, b"Service Unavailable (injected)", {"Content-Type": "text/plain"})
+
+            hit = cassette.match(self.command, host, _redact_path(parts.path), parts.query)
+            if hit is None:
+                bump("unmatched")
+                msg = f"No recording for {self.command} {host}{parts.path}"
+                return self._reply(404, msg.encode("utf-8"), {"Content-Type": "text/plain"})
+            bump("replayed")
+            return self._reply(hit["status"], _decode_body(hit), hit.get("headers") or {})
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _handle
+
+    return Handler
+
+def serve(cassette_path: str, host: str = "127.0.0.1", port: int = 8765, cfg: StubConfig = None):
+    cassette = Cassette.load(cassette_path)
+    server = ThreadingHTTPServer((host, port), make_handler(cassette, cfg or StubConfig()))
+    print(f"[STUB] Replaying {cassette_path} on http://{host}:{server.server_port}")
+    return server
+
+# ================== Fake credentials ==================
+def write_fake_credentials(path: str):
+    import rsa
+    _, priv = rsa.newkeys(2048)
+    data = {
+        "type": "service_account",
+        "project_id": "replay",
+        "private_key_id": "replay",
+        "private_key": priv.save_pkcs1().decode("ascii"),
+        "client_email": "replay@replay.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+# ================== CLI ==================
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("serve", help="serve a recorded cassette")
+    s.add_argument("cassette")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8765)
+    s.add_argument("--latency-ms", type=float, default=0)
+    s.add_argument("--jitter-ms", type=float, default=0)
+    s.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    s.add_argument("--inject-401", type=float, default=0.0, help="fraction of requests answered 401")
+    s.add_argument("--inject-429", type=float, default=0.0, help="fraction of requests answered 429")
+    s.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on injected 429s")
+    s.add_argument("--inject-path", default="", help="only inject on paths matching this regex")
+    s.add_argument("--seed", type=int, default=None)
+
+    c = sub.add_parser("fake-credentials", help="write a throwaway service-account credentials.json")
+    c.add_argument("path", nargs="?", default="credentials.json")
+
+    args = ap.parse_args(argv)
+    if args.cmd == "fake-credentials":
+        write_fake_credentials(args.path)
+        print(f"Wrote {args.path}")
+        return
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    cfg = StubConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        inject_401=args.inject_401, inject_429=args.inject_429,
+        retry_after=args.retry_after, inject_path=args.inject_path,
+    )
+    server = serve(args.cassette, args.host, args.port, cfg)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
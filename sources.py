@@ -0,0 +1,157 @@
+"""
+Multi-source input for the MI export.
+
+Reads several sources (Google Sheets, CSV, XLSX), renames their columns into
+the MI layout, and merges them on the barcode into a single DataFrame for
+write_csv(). Enabled by pointing SOURCES_CONFIG at a JSON file:
+
+    {
+      "key": "Barcodes",
+      "how": "left",
+      "columns": ["Barcodes", "Name", "Price", "Qty"],
+      "sources": [
+        {"name": "stock",  "type": "sheet", "sheet_id": "...", "worksheet": "Stock",
+         "columns": {"Barcode": "Barcodes", "Item": "Name", "On hand": "Qty"}},
+        {"name": "prices", "type": "csv",  "path": "data/prices.csv",
+         "columns": {"barcode": "Barcodes", "price": "Price"}},
+        {"name": "branch", "type": "xlsx", "path": "data/branch.xlsx", "sheet": "Sheet1",
+         "columns": {"Barcode": "Barcodes", "Qty": "Qty"}}
+      ]
+    }
+
+- "columns" on a source maps source column -> output column. Only mapped
+  columns are read. Without a mapping, every column is kept under its own name.
+- Precedence is list order. For each barcode and column, the first source
+  with a non-empty value wins, and later sources only fill gaps.
+- "how": "left" keeps only the first source's barcodes; "outer" keeps every
+  barcode seen in any source.
+- "columns" at the top level fixes the output column order. The default is
+  the order in which columns are first seen.
+- Relative paths are resolved against the config file's directory.
+
+Sources are loaded concurrently. The merge is a hash join on the barcode
+index, and values stay strings so leading zeros survive.
+"""
+import json
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+SOURCE_TYPES = ("sheet", "csv", "xlsx")
+
+def load_config(path) -> dict:
+    path = Path(path)
+    config = json.loads(path.read_text(encoding="utf-8"))
+    config.setdefault("key", "Barcodes")
+    config.setdefault("how", "left")
+    if config["how"] not in ("left", "outer"):
+        raise ValueError(f"Unknown merge 'how': {config['how']}")
+    if not config.get("sources"):
+        raise ValueError(f"No sources defined in {path}")
+    for i, spec in enumerate(config["sources"]):
+        spec.setdefault("name", f"source{i + 1}")
+        if spec.get("type") not in SOURCE_TYPES:
+            raise ValueError(f"Source {spec['name']!r}: type must be one of {SOURCE_TYPES}")
+        if "path" in spec and not Path(spec["path"]).is_absolute():
+            spec["path"] = str(path.parent / spec["path"])
+    return config
+
+def _read_csv(spec, wanted):
+    return pd.read_csv(
+        spec["path"],
+        sep=spec.get("sep", ","),
+        encoding=spec.get("encoding", "utf-8"),
+        dtype=str,
+        keep_default_na=False,
+        usecols=(lambda c: c in wanted) if wanted else None,
+    )
+
+def _xlsx_cell(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))  # Excel stores whole numbers (barcodes) as floats
+    return str(v)
+
+def _read_xlsx(spec, wanted):
+    # openpyxl's streaming reader, picking only the wanted columns per row;
+    # much faster than pd.read_excel on 100k-row exports
+    from openpyxl import load_workbook
+
+    wb = load_workbook(spec["path"], read_only=True, data_only=True)
+    try:
+        sheet = spec.get("sheet")
+        ws = wb[sheet] if sheet else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header = [_xlsx_cell(v) for v in next(rows, ())]
+        keep = [i for i, h in enumerate(header) if not wanted or h in wanted]
+        data = []
+        for r in rows:
+            data.append([_xlsx_cell(r[i]) if i < len(r) else "" for i in keep])
+    finally:
+        wb.close()
+    return pd.DataFrame(data, columns=[header[i] for i in keep])
+
+def load_source(spec, key, read_sheet) -> pd.DataFrame:
+    """Read one source, apply its column mapping and index it by the key."""
+    mapping = spec.get("columns") or {}
+    wanted = set(mapping) if mapping else None
+    if spec["type"] == "sheet":
+        df = read_sheet(spec, wanted)
+    elif spec["type"] == "csv":
+        df = _read_csv(spec, wanted)
+    else:
+        df = _read_xlsx(spec, wanted)
+
+    if mapping:
+        missing = [c for c in mapping if c not in df.columns]
+        if missing:
+            raise RuntimeError(f"Source {spec['name']!r} is missing columns: {missing}")
+        df = df[list(mapping)].rename(columns=mapping)
+    if key not in df.columns:
+        raise RuntimeError(f"Source {spec['name']!r} has no {key!r} column. Columns: {list(df.columns)}")
+
+    df = df.astype(str)
+    df[key] = df[key].str.strip()
+    df = df[df[key] != ""]
+    # a barcode listed twice in one source: the first row wins
+    df = df.drop_duplicates(subset=key, keep="first").set_index(key)
+    # empty cells must not override values from lower-precedence sources
+    return df.replace("", np.nan)
+
+def merge_sources(frames, how="left") -> pd.DataFrame:
+    """Coalesce key-indexed frames in precedence order (first non-empty value wins)."""
+    merged = frames[0]
+    for df in frames[1:]:
+        merged = merged.combine_first(df)
+    if how == "left":
+        merged = merged.reindex(frames[0].index)
+    return merged
+
+def load_merged(config, read_sheet) -> pd.DataFrame:
+    """
+    Load every source in config concurrently and merge them into one
+    MI-shaped DataFrame (key first unless "columns" says otherwise).
+    read_sheet(spec, wanted_columns) must return a str DataFrame for sheet sources.
+    """
+    key = config["key"]
+    specs = config["sources"]
+    with ThreadPoolExecutor(max_workers=min(len(specs), 8)) as pool:
+        frames = list(pool.map(lambda spec: load_source(spec, key, read_sheet), specs))
+
+    merged = merge_sources(frames, config["how"])
+
+    seen = []
+    for df in frames:
+        seen.extend(c for c in df.columns if c not in seen)
+    order = config.get("columns") or [key] + seen
+    out = merged.reset_index().rename(columns={"index": key})
+    for col in order:
+        if col not in out.columns:
+            out[col] = ""
+    out = out[order].fillna("")
+    if out.empty:
+        raise RuntimeError("Merged sources produced no rows.")
+    return out
@@ -0,0 +1,325 @@
+"""
+Storage backends for the dashboard: uploaded CSV exports and the status feed.
+
+    STORAGE_BACKEND   "local" (default) or "s3"
+    S3_BUCKET         bucket name (s3)
+    S3_PREFIX         key prefix inside the bucket, e.g. "suppy/" (s3)
+    S3_ENDPOINT_URL   custom endpoint for MinIO / other S3-compatible stores (s3)
+    S3_REGION         region name (s3, optional)
+    STORAGE_CACHE_DIR local read-through cache for downloads (s3, optional)
+    STORAGE_CACHE_MB  cache size cap in MB (default 512)
+
+The s3 backend needs boto3 (`pip install boto3`); credentials come from the
+usual AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY env vars.
+
+Both backends expose the same interface:
+    save(name, stream)        store a file, reading the stream in chunks
+    open(name)                binary file-like object for streaming reads
+    exists(name)
+    list(suffix)              [{"name", "size", "mtime"}] newest first
+    append_status(line)       add one line to the status feed
+    tail_status(limit)        last `limit` status lines, oldest first
+    version(kind)             cheap change marker for "files" / "status", or
+                              None when the backend cannot tell without a scan
+"""
+import os
+import uuid
+import hashlib
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+CHUNK = 1024 * 1024
+
+# ================== Local disk ==================
+class LocalStorage:
+    def __init__(self, files_dir: Path, status_path: Path):
+        self.files_dir = Path(files_dir)
+        self.status_path = Path(status_path)
+        self.files_dir.mkdir(parents=True, exist_ok=True)
+        self.status_path.parent.mkdir(parents=True, exist_ok=True)
+        self._status_lock = threading.Lock()
+
+    def _path(self, name: str) -> Path:
+        p = (self.files_dir / name).resolve()
+        if p.parent != self.files_dir.resolve():
+            raise FileNotFoundError(name)
+        return p
+
+    def save(self, name, stream):
+        dest = self._path(name)
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.part")
+        with open(tmp, "wb") as out:
+            shutil.copyfileobj(stream, out, CHUNK)
+        os.replace(tmp, dest)
+
+    def open(self, name):
+        return open(self._path(name), "rb")
+
+    def exists(self, name):
+        try:
+            return self._path(name).is_file()
+        except FileNotFoundError:
+            return False
+
+    def list(self, suffix=""):
+        items = []
+        for p in self.files_dir.glob(f"*{suffix}"):
+            if p.name.startswith("."):
+                continue  # in-progress save() temp file
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue  # replaced or removed since the glob
+            items.append({"name": p.name, "size": st.st_size, "mtime": st.st_mtime})
+        items.sort(key=lambda x: x["mtime"], reverse=True)
+        return items
+
+    def append_status(self, line):
+        with self._status_lock:
+            with open(self.status_path, "a", encoding="utf-8") as f:
+                f.write(line.rstrip("\n") + "\n")
+
+    def tail_status(self, limit=200):
+        if not self.status_path.exists():
+            return []
+        return self.status_path.read_text(encoding="utf-8").splitlines()[-limit:]
+
+    def version(self, kind):
+        # adding/replacing an upload renames into the directory, which bumps its
+        # mtime; the status log grows on every append
+        try:
+            st = (self.files_dir if kind == "files" else self.status_path).stat()
+        except FileNotFoundError:
+            return (0, 0)
+        return (st.st_mtime_ns, st.st_size)
+
+# ================== S3-compatible object store ==================
+class S3Storage:
+    """
+    Files live under <prefix>files/<name>. Object stores cannot append, so the
+    status feed is kept in segments: each process writes its lines to its own
+    object <prefix>status/<YYYYMMDD>/<HHMMSSffffff>-<rand> (named after the
+    segment's start), rewriting it on every append and starting a new one each
+    hour or after STATUS_SEGMENT_LINES lines. Every line is stored as
+    "<YYYYMMDDHHMMSSffffff>\t<line>" so segments from several processes merge
+    in time order.
+
+    A tail lists the days that have segments, newest first, stopping once it
+    has enough lines, and GETs only segments whose ETag changed; parsed
+    segments are kept in an LRU of STATUS_CACHE_SEGMENTS, so a poll usually
+    costs two LISTs and one GET of the segment being written.
+    """
+    STATUS_SEGMENT_LINES = 500
+    STATUS_CACHE_SEGMENTS = 256
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, region=None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3).")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3 = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+        self._segments = OrderedDict()  # key -> (etag, [(stamp, line)])
+        self._segments_lock = threading.Lock()
+        self._writing = None  # (key, hour, [encoded lines]) for this process
+        self._write_lock = threading.Lock()
+
+    def _file_key(self, name):
+        return f"{self.prefix}files/{name}"
+
+    def save(self, name, stream):
+        self.s3.upload_fileobj(stream, self.bucket, self._file_key(name))
+
+    def open(self, name):
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=self._file_key(name))["Body"]
+        except self.s3.exceptions.NoSuchKey:
+            raise FileNotFoundError(name)
+
+    def head(self, name):
+        try:
+            return self.s3.head_object(Bucket=self.bucket, Key=self._file_key(name))
+        except Exception:
+            return None
+
+    def exists(self, name):
+        return self.head(name) is not None
+
+    def _iter_objects(self, prefix):
+        for page in self.s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            yield from page.get("Contents", [])
+
+    def list(self, suffix=""):
+        base = self._file_key("")
+        items = []
+        for obj in self._iter_objects(base):
+            name = obj["Key"][len(base):]
+            if "/" in name or not name.endswith(suffix):
+                continue
+            items.append({"name": name, "size": obj["Size"], "mtime": obj["LastModified"].timestamp()})
+        items.sort(key=lambda x: x["mtime"], reverse=True)
+        return items
+
+    def append_status(self, line):
+        now = datetime.now(timezone.utc)
+        entry = f"{now:%Y%m%d%H%M%S%f}\t{line.rstrip(chr(10))}"
+        with self._write_lock:
+            key, hour, lines = self._writing or (None, None, [])
+            if key is None or hour != f"{now:%Y%m%d%H}" or len(lines) >= self.STATUS_SEGMENT_LINES:
+                key = f"{self.prefix}status/{now:%Y%m%d}/{now:%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+                hour, lines = f"{now:%Y%m%d%H}", []
+            lines.append(entry)
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body="\n".join(lines).encode("utf-8"))
+            self._writing = (key, hour, lines)
+
+    def _segment(self, key, etag):
+        with self._segments_lock:
+            hit = self._segments.get(key)
+            if hit and hit[0] == etag:
+                self._segments.move_to_end(key)
+                return hit[1]
+        body = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read().decode("utf-8")
+        entries = [tuple(raw.split("\t", 1)) for raw in body.splitlines()]
+        with self._segments_lock:
+            self._segments[key] = (etag, entries)
+            self._segments.move_to_end(key)
+            while len(self._segments) > self.STATUS_CACHE_SEGMENTS:
+                self._segments.popitem(last=False)
+        return entries
+
+    def _status_days(self):
+        """Day prefixes that hold status segments, newest first (one LIST)."""
+        days = []
+        pages = self.s3.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=f"{self.prefix}status/", Delimiter="/")
+        for page in pages:
+            days.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+        return sorted(days, reverse=True)
+
+    def tail_status(self, limit=200):
+        # only days that have segments are listed, so a sparse feed costs one
+        # LIST per day actually read
+        entries = []
+        for day in self._status_days():
+            for obj in self._iter_objects(day):
+                entries.extend(self._segment(obj["Key"], obj.get("ETag")))
+            if len(entries) >= limit:
+                break
+        entries.sort(key=lambda e: e[0])
+        return [line for _, line in entries[-limit:]]
+
+    def version(self, kind):
+        # one LIST, so every worker sees the same marker: the files' keys and
+        # ETags, or today's status segments (each append rewrites the newest)
+        if kind == "files":
+            objs = self._iter_objects(self._file_key(""))
+        else:
+            objs = self._iter_objects(f"{self.prefix}status/{datetime.now(timezone.utc):%Y%m%d}/")
+        marker = hashlib.sha1()
+        for obj in objs:
+            marker.update(f"{obj['Key']}\0{obj.get('ETag')}\n".encode("utf-8"))
+        return marker.hexdigest()
+
+# ================== Read-through cache ==================
+class CachedStorage:
+    """
+    Wraps a remote backend and keeps downloaded files on local disk, LRU-evicted
+    past max_bytes. Entries are revalidated against the remote size/ETag, so an
+    overwritten upload is fetched again.
+    """
+    def __init__(self, inner, cache_dir: Path, max_bytes: int):
+        self.inner = inner
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # name -> (etag, size)
+
+    def __getattr__(self, attr):
+        return getattr(self.inner, attr)
+
+    def save(self, name, stream):
+        self.inner.save(name, stream)
+        self._drop(name)
+
+    def _drop(self, name):
+        with self._lock:
+            self._index.pop(name, None)
+        (self.cache_dir / name).unlink(missing_ok=True)
+
+    def open(self, name):
+        head = self.inner.head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        tag = (head.get("ETag"), head.get("ContentLength"))
+        local = self.cache_dir / name
+        with self._lock:
+            hit = self._index.get(name) == tag and local.exists()
+            if hit:
+                self._index.move_to_end(name)
+        if hit:
+            return open(local, "rb")
+
+        tmp = local.with_name(f".{local.name}.{uuid.uuid4().hex}.part")
+        with self.inner.open(name) as src, open(tmp, "wb") as out:
+            shutil.copyfileobj(src, out, CHUNK)
+        os.replace(tmp, local)
+        with self._lock:
+            self._index[name] = tag
+            self._index.move_to_end(name)
+        self._evict()
+        return open(local, "rb")
+
+    def _evict(self):
+        with self._lock:
+            total = sum(size or 0 for _, size in self._index.values())
+            while total > self.max_bytes and len(self._index) > 1:
+                name, (_, size) = self._index.popitem(last=False)
+                (self.cache_dir / name).unlink(missing_ok=True)
+                total -= size or 0
+
+# ================== Lazy per-process wrapper ==================
+class LazyStorage:
+    """Builds the backend on first use in each process (safe to import before fork)."""
+    def __init__(self, factory):
+        self._factory = factory
+        self._pid = None
+        self._store = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._store = self._factory()
+                    self._pid = pid
+        return self._store
+
+    def __getattr__(self, attr):
+        return getattr(self._get(), attr)
+
+# ================== Factory ==================
+def from_env(files_dir: Path, status_path: Path):
+    backend = os.getenv("STORAGE_BACKEND", "local").strip().lower()
+    if backend == "local":
+        return LocalStorage(files_dir, status_path)
+    if backend == "s3":
+        bucket = os.getenv("S3_BUCKET", "").strip()
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET.")
+        store = S3Storage(
+            bucket,
+            prefix=os.getenv("S3_PREFIX", "").strip(),
+            endpoint_url=os.getenv("S3_ENDPOINT_URL", "").strip(),
+            region=os.getenv("S3_REGION", "").strip(),
+        )
+        cache_dir = os.getenv("STORAGE_CACHE_DIR", "").strip()
+        if cache_dir:
+            store = CachedStorage(store, Path(cache_dir), int(os.getenv("STORAGE_CACHE_MB", "512")) * 1024 * 1024)
+        return store
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {backend}")